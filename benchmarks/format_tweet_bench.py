@@ -0,0 +1,56 @@
+#######################################################################################################
+# Micro-benchmark for the text cleaning of format_tweet. Run it from the project's root folder with   #
+# python -m benchmarks.format_tweet_bench                                                             #
+#######################################################################################################
+from utils import other_utils
+import json
+import os
+import time
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_tweets.json")
+
+
+# this is how format_tweet cleaned a tweet before: clear_text, and again clear_text inside only_useful_words
+def two_passes(text):
+    cleared_text = other_utils.clear_text(text)
+    useful_words = other_utils.only_useful_words(text)
+    return cleared_text, useful_words
+
+
+# and this is how it cleans it now, only one pass of clear_text
+def one_pass(text):
+    cleared_text = other_utils.clear_text(text)
+    useful_words = other_utils.useful_words_of(cleared_text)
+    return cleared_text, useful_words
+
+
+# function that runs the given cleaning function over the corpus for a number of rounds
+# and returns how many tweets per second it managed to clean
+def measure(function, tweets, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in tweets:
+            function(text)
+    elapsed = time.perf_counter() - start
+    return (len(tweets) * rounds) / elapsed
+
+
+def main(rounds=50):
+    with open(corpus_path) as datafile:
+        tweets = json.load(datafile)
+
+    # both ways must give exactly the same results, otherwise the numbers mean nothing
+    for text in tweets:
+        assert two_passes(text) == one_pass(text), text
+
+    one_pass(tweets[0])  # warm up NLTK's lazy loaded tokenizer, so it's not counted in the first measure
+    before = measure(two_passes, tweets, rounds)
+    after = measure(one_pass, tweets, rounds)
+    print("Corpus: " + str(len(tweets)) + " tweets x " + str(rounds) + " rounds")
+    print("Before (two passes): " + str(round(before, 1)) + " tweets/sec")
+    print("After  (one pass):   " + str(round(after, 1)) + " tweets/sec")
+    print("Speed-up: x" + str(round(after / before, 2)))
+
+
+if __name__ == '__main__':
+    main()
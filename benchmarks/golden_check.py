@@ -0,0 +1,36 @@
+#######################################################################################################
+# Golden-output check for the text cleaning of format_tweet. Every tweet of expected_tweets.json has  #
+# the tokens of NLTK's word_tokenize, the tokens after re_build_text and the entities that            #
+# clear_text must find in it. Run it from the project's root folder with                              #
+# python -m benchmarks.golden_check                                                                   #
+#######################################################################################################
+from utils import other_utils
+from nltk.tokenize import word_tokenize
+import json
+import os
+
+expected_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expected_tweets.json")
+
+
+def main():
+    with open(expected_path, encoding="utf-8") as datafile:
+        expected_tweets = json.load(datafile)
+
+    for expected in expected_tweets:
+        text = expected["text"]
+        # the tokens that re_build_text gets, if they changed (e.g. a new NLTK) the rest is checked on other input
+        assert word_tokenize(text) == expected["tokens"], "word_tokenize: " + text
+        # a copy, so the expected tokens are not changed if re_build_text edits its list
+        assert other_utils.re_build_text(list(expected["tokens"])) == expected["rebuilt"], "re_build_text: " + text
+
+        cleared_text = other_utils.clear_text(text)
+        for kind in ["hashtags", "mentions", "urls"]:
+            assert cleared_text[kind] == expected[kind], kind + ": " + text
+        all_entities = expected["hashtags"] + expected["mentions"] + expected["urls"]
+        assert sorted(cleared_text["entities"]) == sorted(all_entities), "entities: " + text
+
+    print("All " + str(len(expected_tweets)) + " tweets give the expected tokens, hashtags, mentions and urls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#######################################################################################################
+# In-memory stand-in for a MongoDB collection, with only the operations that db_utils uses to store   #
+# tweets. It lets the benchmarks run on a machine without mongod, measuring our own overhead only.    #
+#######################################################################################################
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+# stands in for db_utils.increase_documents, that writes the updates with a bulk_write of pymongo's UpdateOne
+def increase_documents(target, updates):
+    for query, increments in updates:
+        target.update_one(query, {"$inc": increments}, upsert=True)
+
+
+class MemoryDatabase(object):
+    def __init__(self, name="benchmark"):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(self, name)
+        return self.collections[name]
+
+
+class MemoryCollection(object):
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.documents = {}
+
+    def insert(self, document):
+        key = self.key_of(document)
+        if key in self.documents:
+            raise DuplicateKeyError("E11000 duplicate key error: " + str(key))
+        self.documents[key] = document
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        inserted = 0
+        for index, document in enumerate(documents):
+            key = self.key_of(document)
+            if key in self.documents:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR,
+                               "errmsg": "E11000 duplicate key error: " + str(key)})
+                if ordered:
+                    break
+                continue
+            self.documents[key] = document
+            inserted += 1
+        if errors:
+            raise BulkWriteError({"nInserted": inserted, "writeErrors": errors})
+
+    def update_one(self, query, update, upsert=False):
+        key = self.query_key(query)
+        if key not in self.documents:
+            if not upsert:
+                return
+            self.documents[key] = dict(query)
+        document = self.documents[key]
+        for path, amount in update.get("$inc", {}).items():
+            target = document
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = target.get(parts[-1], 0) + amount
+
+    def find_one(self, query):
+        return self.documents.get(self.query_key(query))
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def create_indexes(self, indexes):
+        return []
+
+    # the key of the document that an update or a find_one with an exact query refers to
+    def query_key(self, query):
+        if list(query.keys()) == ["_id"]:
+            return query["_id"]
+        return repr(sorted(query.items()))
+
+    # documents without an _id get one, like MongoDB does
+    def key_of(self, document):
+        if "_id" not in document:
+            document["_id"] = len(self.documents) + 1
+        return document["_id"]
@@ -0,0 +1,106 @@
+#######################################################################################################
+# Check that the compiled classifiers of naive_bayes give exactly the labels of the NLTK objects they #
+# come from. It trains small NLTK models on documents made from a fixed seed, the same way training   #
+# and tweet_training do, compiles them and compares the labels of every document. Run it from the     #
+# project's root folder with python -m benchmarks.naive_bayes_check                                   #
+#######################################################################################################
+from utils import naive_bayes
+from benchmarks import synthetic
+from nltk.classify import NaiveBayesClassifier
+from nltk.sentiment import SentimentAnalyzer
+from nltk.sentiment.util import extract_unigram_feats
+import random
+
+UNKNOWN_WORDS = ["zebra", "quantum", "violin", "glacier"]  # words that no training document has
+
+
+# returns a list of (words, label) documents. Every label draws more of its own words, and all of them draw
+# from the neutral words, so the classifiers have to weigh the words and some documents are close calls
+def make_documents(generator, count, labels):
+    own_words = {labels[0]: synthetic.POSITIVE_WORDS, labels[1]: synthetic.NEGATIVE_WORDS}
+    documents = []
+    for _ in range(count):
+        label = generator.choice(labels)
+        words = []
+        for _ in range(generator.randint(0, 12)):
+            pick = generator.random()
+            if pick < 0.35:
+                words.append(generator.choice(own_words[label]))
+            elif pick < 0.5:
+                words.append(generator.choice(own_words[labels[1] if label == labels[0] else labels[0]]))
+            elif pick < 0.95:
+                words.append(generator.choice(synthetic.NEUTRAL_WORDS))
+            else:
+                words.append(generator.choice(UNKNOWN_WORDS))
+        documents.append((words, label))
+    return documents
+
+
+# the label_counts and word_counts of bag_of_words_classifier and unigram_classifier for the documents
+def document_counts(documents, words=()):
+    label_counts = {}
+    word_counts = {word: {} for word in words}
+    for document_words, label in documents:
+        label_counts[label] = label_counts.get(label, 0) + 1
+        for word in set(document_words):
+            counts = word_counts.setdefault(word, {})
+            counts[label] = counts.get(label, 0) + 1
+    return label_counts, word_counts
+
+
+# asserts that the compiled classifier gives the label that classify gives, for every list of tokens
+def assert_same_labels(name, compiled, classify, token_lists):
+    expected = [classify(tokens) for tokens in token_lists]
+    assert compiled.classify_batch(token_lists) == expected, name + ": classify_batch"
+    for tokens, label in zip(token_lists, expected):  # one at a time too, like the stream without the pool
+        assert compiled.classify(tokens) == label, name + ": classify " + str(tokens)
+    print(name + ": the same labels for all " + str(len(token_lists)) + " documents")
+
+
+# the polarity classifier: NaiveBayesClassifier on featuresets like training.bag_of_words makes ({word: True})
+def check_bag_of_words(train_documents, token_lists):
+    featuresets = [({word: True for word in words}, label) for words, label in train_documents]
+    classifier = NaiveBayesClassifier.train(featuresets)
+
+    def classify(tokens):
+        return classifier.classify({word: True for word in tokens})
+
+    assert_same_labels("bag of words, compiled", naive_bayes.compile_bag_of_words(classifier), classify, token_lists)
+    counted = naive_bayes.bag_of_words_classifier(*document_counts(train_documents))
+    assert_same_labels("bag of words, from counts", naive_bayes.compile_bag_of_words(counted), classify,
+                       token_lists)
+    assert [counted.classify({word: True for word in tokens}) for tokens in token_lists] == \
+        [classify(tokens) for tokens in token_lists], "bag of words, from counts: classify"
+
+
+# the subjectivity analyzer: a SentimentAnalyzer with extract_unigram_feats, like train_sentiment_analyzer_subjectivity
+def check_unigrams(train_documents, token_lists):
+    sentim_analyzer = SentimentAnalyzer()
+    all_words = sentim_analyzer.all_words([words for words, _ in train_documents])
+    unigrams = sentim_analyzer.unigram_word_feats(all_words, min_freq=2)
+    sentim_analyzer.add_feat_extractor(extract_unigram_feats, unigrams=unigrams)
+    training_set = sentim_analyzer.apply_features(train_documents)
+    sentim_analyzer.train(NaiveBayesClassifier.train, training_set)
+
+    assert_same_labels("unigrams, compiled", naive_bayes.compile_unigram_analyzer(sentim_analyzer),
+                       sentim_analyzer.classify, token_lists)
+
+    label_counts, word_counts = document_counts(train_documents, unigrams)
+    counted = SentimentAnalyzer()
+    counted.add_feat_extractor(extract_unigram_feats, unigrams=sorted(unigrams))
+    counted.classifier = naive_bayes.unigram_classifier(label_counts, {word: word_counts[word] for word in unigrams})
+    assert_same_labels("unigrams, from counts", naive_bayes.compile_unigram_analyzer(counted),
+                       sentim_analyzer.classify, token_lists)
+
+
+def main(seed=42, train_size=400, test_size=400):
+    generator = random.Random(seed)
+    for labels, check in [(["pos", "neg"], check_bag_of_words), (["subj", "obj"], check_unigrams)]:
+        train_documents = make_documents(generator, train_size, labels)
+        # the training documents, new ones, and an empty one that only the bias decides
+        token_lists = [words for words, _ in train_documents + make_documents(generator, test_size, labels)] + [[]]
+        check(train_documents, token_lists)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#######################################################################################################
+# Benchmark of every stage of the pipeline and of the whole pipeline, on synthetic tweets. Run it    #
+# from the project's root folder:                                                                     #
+#     python -m benchmarks.pipeline_bench --tweets 2000 --mongo memory --output results.json          #
+# --mongo memory uses an in-memory stand-in for MongoDB, --mongo localhost:27017 a real mongod        #
+#######################################################################################################
+from utils import other_utils, sentiment_utils, db_utils
+from benchmarks import synthetic, memory_db
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+try:
+    from nltk.tokenize import word_tokenize
+except ImportError as e:
+    sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
+
+BENCHMARK_DATABASE = "sa_benchmark"
+mongo_increase_documents = db_utils.increase_documents  # the one for a real mongod, the stand-in replaces it
+
+
+# returns the value of a sorted list at the given percentile (nearest rank)
+def percentile(sorted_values, percent):
+    if len(sorted_values) == 0:
+        return 0
+    rank = max(1, int(round(percent / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# runs function once for every item and returns the throughput and the latency percentiles in milliseconds.
+# tweets is the number of tweets in items, when every item is a batch of them. The outputs of the function
+# are returned too, so that the next stage can use them
+def measure(function, items, tweets=None):
+    latencies = []
+    outputs = []
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        outputs.append(function(item))
+        latencies.append(time.perf_counter() - item_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if tweets is None:
+        tweets = len(items)
+    result = {"tweets": tweets,
+              "seconds": round(elapsed, 4),
+              "per_second": round(tweets / elapsed, 1) if elapsed > 0 else None,
+              "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+              "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+              "p99_ms": round(percentile(latencies, 99) * 1000, 4)}
+    return result, outputs
+
+
+# selects a new collection for the given target: "memory" or "host:port" of a mongod. Returns the client,
+# or None for the in-memory stand-in, so that we can drop the benchmark database at the end
+def select_collection(target, name):
+    if target == "memory":
+        db_utils.set_collection(memory_db.MemoryDatabase(BENCHMARK_DATABASE)[name])
+        db_utils.increase_documents = memory_db.increase_documents  # the stand-in has no bulk_write
+        return None
+    db_utils.increase_documents = mongo_increase_documents
+    host, _, port = target.partition(":")
+    response = db_utils.can_connect(host, port or 27017)
+    if not response["connect"]:
+        sys.exit("[SEVERE] Can't connect to MongoDB: " + response["errors"])
+    client = db_utils.get_client()
+    db_utils.set_collection(client[BENCHMARK_DATABASE][name])
+    return client
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(tweets_number=2000, seed=42, target="memory", batch_size=100):
+    stages = {}
+    skipped = {}
+
+    raw_tweets = [json.dumps(tweet) for tweet in synthetic.generate_tweets(tweets_number, seed)]
+    stages["json_decode"], decoded = measure(json.loads, raw_tweets)
+
+    # only the tweets the listener keeps, go through the rest of the stages
+    tweets = [tweet for tweet in decoded if "user" in tweet and tweet["lang"] == "en"]
+    texts = [tweet["text"] for tweet in tweets]
+
+    stages["tokenize"], tokens = measure(word_tokenize, texts)
+    stages["re_build_text"], _ = measure(lambda token_list: other_utils.re_build_text(list(token_list)), tokens)
+    stages["clear_text"], cleared_texts = measure(other_utils.clear_text, texts)
+    useful_words = [other_utils.useful_words_of(cleared_text) for cleared_text in cleared_texts]
+
+    stages["textblob"], textblob_results = measure(sentiment_utils.textblob_scores, useful_words)
+    stages["vader"], vader_results = measure(sentiment_utils.vader_polarity, useful_words)
+
+    # the custom classifiers exist only after the training
+    have_models = os.path.exists(sentiment_utils.POLARITY_MODEL) and \
+        os.path.exists(sentiment_utils.SUBJECTIVITY_MODEL)
+    if have_models:
+        stages["nltk_polarity"], _ = measure(sentiment_utils.sent_result_polarity, useful_words)
+        stages["nltk_subjectivity"], _ = measure(sentiment_utils.sent_result_subjectivity, useful_words)
+    else:
+        skipped["nltk_polarity"] = skipped["nltk_subjectivity"] = skipped["pipeline"] = \
+            "classifier files not found, run the training first"
+
+    # the documents we store, with the labels we could compute
+    documents = [other_utils.build_document(tweet, cleared_text,
+                                            {"textblob": textblob, "vader": {"polarity": vader}, "training": {}},
+                                            [])
+                 for tweet, cleared_text, textblob, vader in zip(tweets, cleared_texts, textblob_results,
+                                                                 vader_results)]
+
+    client = select_collection(target, "store_tweet")
+    stages["store_tweet"], _ = measure(db_utils.store_tweet, [dict(document) for document in documents])
+
+    select_collection(target, "store_tweets")
+    batches = [[dict(document) for document in documents[start:start + batch_size]]
+               for start in range(0, len(documents), batch_size)]
+    stages["store_tweets_batch"], _ = measure(db_utils.store_tweets, batches, tweets=len(documents))
+    stages["store_tweets_batch"]["batch_size"] = batch_size  # its latencies are of a whole batch
+
+    # the whole synchronous path of a tweet: decode, filter, format and store
+    if have_models:
+        select_collection(target, "pipeline")
+
+        def pipeline(raw_tweet):
+            data = json.loads(raw_tweet)
+            if "user" not in data or data["lang"] != "en":
+                return False
+            return db_utils.store_tweet(other_utils.format_tweet(data, method="stream"))
+
+        stages["pipeline"], _ = measure(pipeline, raw_tweets)
+
+    if client is not None:
+        client.drop_database(BENCHMARK_DATABASE)
+
+    return {"meta": {"timestamp": datetime.utcnow().isoformat() + "Z",
+                     "revision": git_revision(),
+                     "python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "tweets": tweets_number,
+                     "english_tweets": len(tweets),
+                     "seed": seed,
+                     "mongo": target},
+            "stages": stages,
+            "skipped": skipped}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pipeline_bench",
+                                     description="Time every stage of the pipeline on synthetic tweets.")
+    parser.add_argument("--tweets", type=int, default=2000, help="number of tweets (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generator (default: %(default)s)")
+    parser.add_argument("--mongo", default="memory",
+                        help="'memory' for the in-memory stand-in or host:port of a mongod (default: memory)")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="tweets per insert_many in store_tweets_batch (default: %(default)s)")
+    parser.add_argument("--output", default=None, help="also write the results in this JSON file")
+    options = parser.parse_args(arguments)
+
+    results = run(options.tweets, options.seed, options.mongo, options.batch_size)
+    report = json.dumps(results, indent=2)
+    print(report)
+    if options.output is not None:
+        with open(options.output, "w") as outfile:
+            outfile.write(report + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#######################################################################################################
+# Generator of synthetic raw tweets, shaped like the data of the Streaming API. They have hashtags,   #
+# mentions, urls, contractions, emoji and long truncated texts, so every stage of the pipeline works.  #
+# To write a file for utils.replay: python -m benchmarks.synthetic --count 10000 -o tweets.jsonl.gz     #
+#######################################################################################################
+import argparse
+import gzip
+import json
+import random
+
+POSITIVE_WORDS = ["love", "great", "amazing", "happy", "best", "awesome", "good", "beautiful", "excited",
+                  "perfect", "fantastic", "nice", "wonderful", "enjoy", "win"]
+NEGATIVE_WORDS = ["hate", "terrible", "awful", "sad", "worst", "bad", "angry", "broken", "disappointed",
+                  "ugly", "horrible", "lost", "fail", "annoying", "boring"]
+NEUTRAL_WORDS = ["the", "game", "phone", "today", "city", "people", "new", "update", "weather", "music",
+                 "movie", "team", "coffee", "train", "work", "news", "election", "market", "school", "weekend",
+                 "morning", "night", "season", "video", "price", "store", "flight", "book", "show", "report"]
+CONTRACTIONS = ["don't", "can't", "isn't", "won't", "they're", "we're", "doesn't", "haven't", "you're"]
+EMOJI = ["\U0001F600", "\U0001F62D", "\U0001F525", "\U0001F44D", "❤️", "\U0001F621", "\U0001F389"]
+PUNCTUATION = ["!", "?", ".", "...", "!!!", ",", " --", "?!"]
+LANGUAGES = ["en"] * 9 + ["es"]  # some tweets are not English, so the listener ignores them
+
+
+def random_word(generator):
+    pick = generator.random()
+    if pick < 0.12:
+        return generator.choice(POSITIVE_WORDS)
+    if pick < 0.24:
+        return generator.choice(NEGATIVE_WORDS)
+    if pick < 0.30:
+        return generator.choice(CONTRACTIONS)
+    if pick < 0.34:
+        return generator.choice(EMOJI)
+    if pick < 0.40:
+        return generator.choice(PUNCTUATION)
+    return generator.choice(NEUTRAL_WORDS)
+
+
+def random_entity(generator):
+    pick = generator.random()
+    if pick < 0.4:
+        return "#" + generator.choice(NEUTRAL_WORDS + POSITIVE_WORDS) + str(generator.randint(0, 99))
+    if pick < 0.75:
+        return "@user_" + str(generator.randint(1, 5000))
+    return "https://t.co/" + "".join(generator.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJ0123456789")
+                                     for _ in range(10))
+
+
+def random_text(generator):
+    words = []
+    if generator.random() < 0.2:  # a retweet
+        words.extend(["RT", "@user_" + str(generator.randint(1, 5000)) + ":"])
+    length = generator.choice([6, 10, 15, 25, 40])  # some tweets are long
+    for _ in range(length):
+        if generator.random() < 0.15:
+            words.append(random_entity(generator))
+        else:
+            words.append(random_word(generator))
+    text = " ".join(words)
+    if len(text) > 280:  # long tweets are truncated with … like the Streaming API does
+        text = text[:279] + "…"
+    return text
+
+
+# returns one raw tweet as a dictionary. id_number makes the id unique
+def generate_tweet(generator, id_number):
+    return {"id": 10 ** 18 + id_number,
+            "id_str": str(10 ** 18 + id_number),
+            "text": random_text(generator),
+            "lang": generator.choice(LANGUAGES),
+            "user": {"id": generator.randint(1, 10 ** 9), "screen_name": "user_" + str(generator.randint(1, 5000))},
+            "created_at": "Mon Jan 01 00:00:00 +0000 2018"}
+
+
+# returns a list of count raw tweets. The same seed always gives the same tweets
+def generate_tweets(count, seed=42):
+    generator = random.Random(seed)
+    return [generate_tweet(generator, number) for number in range(count)]
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic",
+                                     description="Write synthetic raw tweets as JSON lines (gzip if the name "
+                                                 "ends with .gz).")
+    parser.add_argument("--count", type=int, default=10000, help="number of tweets (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generator (default: %(default)s)")
+    parser.add_argument("-o", "--output", required=True, help="file to write")
+    options = parser.parse_args(arguments)
+
+    opener = gzip.open if options.output.endswith(".gz") else open
+    with opener(options.output, "wt", encoding="utf-8") as output:
+        for tweet in generate_tweets(options.count, options.seed):
+            output.write(json.dumps(tweet) + "\n")
+    print("Wrote " + str(options.count) + " tweets in " + options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from tkinter import *
 from tkinter import messagebox
 from utils import *
+from utils import frames
 
 try:
     from pymongo.errors import ServerSelectionTimeoutError, AutoReconnect
@@ -137,6 +138,9 @@ def goto_main_frame(root, frame):
                 active_collection = active_database[collection]
                 db_utils.set_database(active_database)
                 db_utils.set_collection(active_collection)
+                db_utils.start_counters()  # a new collection has complete counters from its first tweet
+                # so the queries of the stats and the charts don't scan the collection, without blocking the GUI
+                db_utils.ensure_indexes_in_thread()
 
             else:  # collection level errors
                 # these are all errors, but we try to find what causes the error
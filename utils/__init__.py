@@ -1,4 +1,3 @@
 from utils import read_write
 from utils import db_utils
-from utils import frames
 from utils import stream_util
@@ -1,9 +1,8 @@
 ###########################################################################################
 # Module that is responsible to show the pie charts of the sentiment analysis results      #
 ###########################################################################################
-from utils import db_utils, read_write
+from utils import db_utils, read_write, dialogs
 from pymongo.errors import ServerSelectionTimeoutError, AutoReconnect
-from tkinter import messagebox
 import sys
 
 try:
@@ -16,161 +15,92 @@ LOG_NAME = " (chart_utils) : "
 
 
 def show_textblob_polarity():
-    try:
-        collection = db_utils.get_collection()
-        all_documents = collection.find()
-        tweets_sum = all_documents.count()
-
-        number_of_textblob_positive = collection.find({"textblob.polarity": 'pos'}).count()
-        number_of_textblob_neutral = collection.find({"textblob.polarity": 'neu'}).count()
-        number_of_textblob_negative = collection.find({"textblob.polarity": 'neg'}).count()
-
-        percent_pos = (number_of_textblob_positive / tweets_sum) * 100
-        percent_neu = (number_of_textblob_neutral / tweets_sum) * 100
-        percent_neg = (number_of_textblob_negative / tweets_sum) * 100
-
-        labels = 'Positive', 'Neutral', 'Negative'
-        sizes = [percent_pos, percent_neu, percent_neg]
-
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-                shadow=True, startangle=90)
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.title('Textblob Polarity')
-        plt.show()
-    except ServerSelectionTimeoutError as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
-    except AutoReconnect as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
+    show_pie_chart("textblob", "polarity", [("pos", 'Positive'), ("neu", 'Neutral'), ("neg", 'Negative')],
+                   'Textblob Polarity')
 
 
 def show_textblob_subjectivity():
-    try:
-        collection = db_utils.get_collection()
-        all_documents = collection.find()
-        tweets_sum = all_documents.count()
-
-        number_of_textblob_subjective = collection.find({"textblob.subjectivity": 'subj'}).count()
-        number_of_textblob_objective = collection.find({"textblob.subjectivity": 'obj'}).count()
-
-        percent_subj = (number_of_textblob_subjective / tweets_sum) * 100
-        percent_obj = (number_of_textblob_objective / tweets_sum) * 100
-
-        labels = 'Subjective', 'Objective'
-        sizes = [percent_subj, percent_obj]
-
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-                shadow=True, startangle=90)
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.title('Textblob Subjectivity')
-        plt.show()
-
-    except ServerSelectionTimeoutError as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
-    except AutoReconnect as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
+    show_pie_chart("textblob", "subjectivity", [("subj", 'Subjective'), ("obj", 'Objective')],
+                   'Textblob Subjectivity')
 
 
 def show_vader_polarity():
-    try:
-        collection = db_utils.get_collection()
-        all_documents = collection.find()
-        tweets_sum = all_documents.count()
+    show_pie_chart("vader", "polarity", [("pos", 'Positive'), ("neu", 'Neutral'), ("neg", 'Negative')],
+                   'VADER Polarity')
 
-        number_of_vader_positive = collection.find({"vader.polarity": 'pos'}).count()
-        number_of_vader_neutral = collection.find({"vader.polarity": 'neu'}).count()
-        number_of_vader_negative = collection.find({"vader.polarity": 'neg'}).count()
 
-        percent_pos = (number_of_vader_positive / tweets_sum) * 100
-        percent_neu = (number_of_vader_neutral / tweets_sum) * 100
-        percent_neg = (number_of_vader_negative / tweets_sum) * 100
+def show_training_polarity():
+    show_pie_chart("training", "polarity", [("pos", 'Positive'), ("neg", 'Negative')],
+                   'NLTK Polarity')
 
-        labels = 'Positive', 'Neutral', 'Negative'
-        sizes = [percent_pos, percent_neu, percent_neg]
 
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-                shadow=True, startangle=90)
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.title('VADER Polarity')
-        plt.show()
-    except ServerSelectionTimeoutError as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
-    except AutoReconnect as e:
-        read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
-        return
+def show_training_subjectivity():
+    show_pie_chart("training", "subjectivity", [("subj", 'Subjective'), ("obj", 'Objective')],
+                   'NLTK Subjectivity')
 
 
-def show_training_polarity():
+# function that draws the pie chart of a field of an analyzer. labels is a list of (stored label, shown label).
+# The counts come from the counters document of db_utils, so a chart costs one small query
+def show_pie_chart(analyzer, field, labels, title):
     try:
-        collection = db_utils.get_collection()
-        all_documents = collection.find()
-        tweets_sum = all_documents.count()
+        summary = db_utils.read_counters()
+        if summary is None:
+            dialogs.show_info(title, "The counters of this collection are not complete. "
+                                     "Press 'Rebuild counters' in the stats to count its tweets.")
+            return
+        tweets_sum = summary["total"]
+        counts = summary[analyzer][field]
 
-        number_of_training_positive = collection.find({"training.polarity": 'pos'}).count()
-        number_of_training_negative = collection.find({"training.polarity": 'neg'}).count()
-
-        percent_pos = (number_of_training_positive / tweets_sum) * 100
-        percent_neg = (number_of_training_negative / tweets_sum) * 100
-
-        labels = 'Positive', 'Negative'
-        sizes = [percent_pos, percent_neg]
+        sizes = [(counts[label] / tweets_sum) * 100 for label, _ in labels]
 
         fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
+        ax1.pie(sizes, labels=[name for _, name in labels], autopct='%1.1f%%',
                 shadow=True, startangle=90)
         ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.title('NLTK Polarity')
+        plt.title(title)
         plt.show()
     except ServerSelectionTimeoutError as e:
         read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
+        dialogs.show_error("Error", "Lost Connection to the DB")
         return
     except AutoReconnect as e:
         read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
+        dialogs.show_error("Error", "Lost Connection to the DB")
         return
 
 
-def show_training_subjectivity():
+# function that draws a line for every analyzer with its net polarity (positive minus negative tweets, as a
+# percentage of all the tweets) in every time bucket. It reads the rollups of db_utils, not the tweets
+def show_polarity_trend(unit="hour"):
     try:
-        collection = db_utils.get_collection()
-        all_documents = collection.find()
-        tweets_sum = all_documents.count()
-
-        number_of_training_subjective = collection.find({"training.subjectivity": 'subj'}).count()
-        number_of_training_objective = collection.find({"training.subjectivity": 'obj'}).count()
-
-        percent_subj = (number_of_training_subjective / tweets_sum) * 100
-        percent_obj = (number_of_training_objective / tweets_sum) * 100
-
-        labels = 'Subjective', 'Objective'
-        sizes = [percent_subj, percent_obj]
+        buckets = db_utils.sentiment_trend(unit=unit)
+        if len(buckets) == 0:
+            dialogs.show_info("Polarity over time", "No tweets with a timestamp found in this collection. If it has "
+                                                    "tweets stored before we kept the time buckets, press "
+                                                    "'Rebuild counters' in the stats.")
+            return
 
         fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%',
-                shadow=True, startangle=90)
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        plt.title('NLTK Subjectivity')
+        for analyzer, name in [("textblob", 'Textblob'), ("vader", 'VADER'), ("training", 'NLTK')]:
+            times = []
+            values = []
+            for bucket in buckets:
+                counts = bucket.get(analyzer, {}).get("polarity", {})
+                times.append(bucket["start"])
+                values.append(((counts.get("pos", 0) - counts.get("neg", 0)) / bucket["total"]) * 100)
+            ax1.plot(times, values, marker='.', label=name)
+        ax1.axhline(0, color='grey', linewidth=0.5)
+        ax1.set_xlabel('Time (UTC), per ' + unit)
+        ax1.set_ylabel('Positive - Negative (%)')
+        ax1.legend()
+        fig1.autofmt_xdate()
+        plt.title('Polarity over time')
         plt.show()
-
     except ServerSelectionTimeoutError as e:
         read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
+        dialogs.show_error("Error", "Lost Connection to the DB")
         return
     except AutoReconnect as e:
         read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-        messagebox.showerror("Error", "Lost Connection to the DB")
+        dialogs.show_error("Error", "Lost Connection to the DB")
         return
@@ -1,14 +1,67 @@
 ######################################################################
 # Module that operates and is responsible for the MongoDB connection #
 ######################################################################
-from utils import read_write
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError, ConfigurationError, DuplicateKeyError
+from utils import read_write, metrics
+from pymongo import MongoClient, IndexModel, UpdateOne, ASCENDING
+from pymongo.errors import ServerSelectionTimeoutError, ConfigurationError, DuplicateKeyError, BulkWriteError, \
+    PyMongoError
 import random
 import string
+import threading
+import time
 
 LOG_NAME = " (db_utils) : "
 
+DUPLICATE_KEY_ERROR = 11000  # MongoDB's error code for a document with an _id that already exists
+
+# every analyzer, the field it stores and the labels this field can have
+SENTIMENT_FIELDS = [
+    ("textblob", "polarity", ["pos", "neu", "neg"]),
+    ("textblob", "subjectivity", ["subj", "obj"]),
+    ("vader", "polarity", ["pos", "neu", "neg"]),
+    ("training", "polarity", ["pos", "neg"]),
+    ("training", "subjectivity", ["subj", "obj"]),
+]
+
+# the tweets that the analyzers agree on, for every label
+AGREEMENTS = {
+    "pos": {"textblob.polarity": "pos", "vader.polarity": "pos", "training.polarity": "pos"},
+    "neg": {"textblob.polarity": "neg", "vader.polarity": "neg", "training.polarity": "neg"},
+    "neu": {"textblob.polarity": "neu", "vader.polarity": "neu"},
+    "subj": {"textblob.subjectivity": "subj", "training.subjectivity": "subj"},
+    "obj": {"textblob.subjectivity": "obj", "training.subjectivity": "obj"},
+}
+
+# indexes that cover the queries on the labels. The compound ones serve the agreement queries and,
+# as their prefix, the queries on the textblob fields too
+SENTIMENT_INDEXES = [
+    [("textblob.polarity", ASCENDING), ("vader.polarity", ASCENDING), ("training.polarity", ASCENDING)],
+    [("textblob.subjectivity", ASCENDING), ("training.subjectivity", ASCENDING)],
+    [("vader.polarity", ASCENDING)],
+    [("training.polarity", ASCENDING)],
+    [("training.subjectivity", ASCENDING)],
+    [("created_at", ASCENDING)],
+]
+
+# every collection has a document in this collection (with the collection's name as _id) that holds the
+# counters of sentiment_summary. We increase them every time we store tweets, so the stats screen and the
+# charts read one small document instead of counting the whole collection. The document is complete if it
+# counts all the tweets: start_counters marks it when the collection is selected empty, rebuild_counters when it
+# counts the collection. One that the first stored tweet created, in a collection that already had tweets,
+# counts only the new tweets, so the stats ask the user to rebuild it
+COUNTERS_COLLECTION = "sentiment_counters"
+COUNTERS_COMPLETE = "complete"
+
+# every stored tweet is counted in a bucket of a minute, an hour and a day, for every keyword it matched and for
+# ROLLUP_ALL_KEYWORDS. Every bucket is a document of this collection, so a trend over a week reads a few hundred
+# documents instead of all the tweets of the week
+ROLLUPS_COLLECTION = "sentiment_rollups"
+ROLLUP_UNITS = ["minute", "hour", "day"]
+ROLLUP_ALL_KEYWORDS = "*"
+
+# collections with more tweets than this, build their indexes in the background, so they are not locked
+BACKGROUND_INDEX_THRESHOLD = 100000
+
 collection = None
 database = None
 client = None
@@ -75,7 +128,9 @@ def can_connect(host, port):
 def store_tweet(tweet):
     global collection
     try:
-        collection.insert(tweet)
+        with metrics.timed("db_write"):
+            collection.insert(tweet)
+            increase_counters([tweet])
         return True
     except DuplicateKeyError as e:
         message = "[ERROR]" + LOG_NAME + "DuplicateKeyError:" + str(e)
@@ -83,6 +138,71 @@ def store_tweet(tweet):
         return False
 
 
+# function that stores a list of tweets in the active collection with one unordered insert_many, so a duplicate
+# tweet doesn't stop the rest from being stored. Returns a tuple (stored, ignored) with the number of tweets
+# that were stored and the number of those that were rejected
+def store_tweets(tweets):
+    global collection
+    if len(tweets) == 0:
+        return 0, 0
+    with metrics.timed("db_write"):  # the whole batch, with its counters and rollups
+        try:
+            collection.insert_many(tweets, ordered=False)
+            increase_counters(tweets)
+            return len(tweets), 0
+        except BulkWriteError as e:
+            # every rejected document has its own write error. Duplicates are expected, so we only log the others
+            rejected = set()
+            for error in e.details["writeErrors"]:
+                rejected.add(error["index"])
+                if error["code"] == DUPLICATE_KEY_ERROR:
+                    print("[ERROR]" + LOG_NAME + "DuplicateKeyError:" + error["errmsg"])
+                else:
+                    read_write.log_message("[ERROR]" + LOG_NAME + "BulkWriteError:" + error["errmsg"])
+                    metrics.increase("errors_total", "db_write")
+            stored = [tweet for index, tweet in enumerate(tweets) if index not in rejected]
+            increase_counters(stored)
+            return len(stored), len(rejected)
+
+
+# Class that gathers the formatted tweets and stores them with store_tweets, when the buffer reaches batch_size
+# tweets or when its oldest tweet is waiting for more than max_wait seconds. With this way we make one
+# round-trip to MongoDB for every batch, instead of one for every tweet
+class TweetWriter(object):
+    def __init__(self, batch_size=100, max_wait=5):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.buffer = []
+        self.oldest_time = None  # time that the oldest tweet of the buffer was added
+        self.lock = threading.RLock()
+
+    # adds a tweet to the buffer and returns (stored, ignored) like store_tweets. If no flush was needed, (0, 0)
+    def add(self, tweet):
+        with self.lock:
+            self.buffer.append(tweet)
+            if self.oldest_time is None:
+                self.oldest_time = time.time()
+            if len(self.buffer) >= self.batch_size or time.time() - self.oldest_time >= self.max_wait:
+                return self.flush()
+            return 0, 0
+
+    # stores every buffered tweet, e.g. when the stream stops or pauses, and returns (stored, ignored)
+    def flush(self):
+        with self.lock:
+            # if we lose the connection, store_tweets raises and we keep the buffer, to try again on the next flush
+            outcome = store_tweets(self.buffer)
+            self.buffer = []
+            self.oldest_time = None
+            return outcome
+
+    # stores the buffered tweets, only if the oldest of them waits for more than max_wait seconds
+    def flush_if_due(self):
+        with self.lock:
+            if self.oldest_time is not None and time.time() - self.oldest_time >= self.max_wait:
+                return self.flush()
+            return 0, 0
+
+
 # this function, return the active MongoDB connection client
 def get_client():
     global client
@@ -108,3 +228,237 @@ def set_collection(name):
 def get_collection():
     global collection
     return collection
+
+
+# function that counts, with one pass over the active collection, the tweets of every label of every analyzer
+# and the tweets that the analyzers agree on. Returns a dictionary like:
+# {"total": 10, "textblob": {"polarity": {"pos": 4, "neu": 3, "neg": 3}, "subjectivity": {...}},
+#  "vader": {...}, "training": {...}, "agree": {"pos": 2, "neg": 1, "neu": 1, "subj": 3, "obj": 2}}
+def sentiment_summary():
+    global collection
+    group = {"_id": None, "total": {"$sum": 1}}
+    for analyzer, field, labels in SENTIMENT_FIELDS:
+        for label in labels:
+            condition = {"$eq": ["$" + analyzer + "." + field, label]}
+            group[analyzer + "_" + field + "_" + label] = {"$sum": {"$cond": [condition, 1, 0]}}
+    for label, query in AGREEMENTS.items():
+        condition = {"$and": [{"$eq": ["$" + key, value]} for key, value in sorted(query.items())]}
+        group["agree_" + label] = {"$sum": {"$cond": [condition, 1, 0]}}
+
+    counts = {}
+    for result in collection.aggregate([{"$group": group}]):  # there is only one result, or none if empty
+        counts = result
+
+    summary = {"total": counts.get("total", 0), "agree": {}}
+    for analyzer, field, labels in SENTIMENT_FIELDS:
+        summary.setdefault(analyzer, {})[field] = {label: counts.get(analyzer + "_" + field + "_" + label, 0)
+                                                   for label in labels}
+    for label in AGREEMENTS:
+        summary["agree"][label] = counts.get("agree_" + label, 0)
+    return summary
+
+
+# function that returns the counters document of the active collection in the form of sentiment_summary,
+# or None if there isn't one, or it isn't complete
+def read_counters():
+    global collection
+    counters = collection.database[COUNTERS_COLLECTION].find_one({"_id": collection.name})
+    if counters is None or not counters.get(COUNTERS_COMPLETE, False):
+        return None
+    summary = {"total": counters.get("total", 0), "agree": {}}
+    for analyzer, field, labels in SENTIMENT_FIELDS:
+        stored_counts = counters.get(analyzer, {}).get(field, {})
+        summary.setdefault(analyzer, {})[field] = {label: stored_counts.get(label, 0) for label in labels}
+    for label in AGREEMENTS:
+        summary["agree"][label] = counters.get("agree", {}).get(label, 0)
+    return summary
+
+
+# function that marks the counters of the active collection as complete, if the collection has no tweets yet,
+# so the counters that the stored tweets increase hold all of them and nobody has to count the collection.
+# $setOnInsert changes nothing if the document exists already, e.g. another ingest process stored tweets
+# between the count and the update. Then it stays incomplete, which is the safe side
+def start_counters():
+    global collection
+    try:
+        if collection.estimated_document_count() > 0:
+            return False
+        collection.database[COUNTERS_COLLECTION].update_one({"_id": collection.name},
+                                                            {"$setOnInsert": {COUNTERS_COMPLETE: True}},
+                                                            upsert=True)
+        return True
+    except PyMongoError as e:
+        message = "[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e)
+        print(message)
+        read_write.log_message(message)
+        return False
+
+
+# function that increases the counters of the active collection, for a list of tweets that we just stored
+def increase_counters(tweets):
+    global collection
+    if len(tweets) == 0:
+        return
+    collection.database[COUNTERS_COLLECTION].update_one({"_id": collection.name},
+                                                        {"$inc": label_increments(tweets)}, upsert=True)
+    increase_rollups(tweets)
+
+
+# function that returns the $inc document that adds the labels of the given tweets to a counters document
+def label_increments(tweets):
+    increments = {"total": len(tweets)}
+    for tweet in tweets:
+        for analyzer, field, labels in SENTIMENT_FIELDS:
+            label = tweet.get(analyzer, {}).get(field)
+            if label in labels:
+                key = analyzer + "." + field + "." + label
+                increments[key] = increments.get(key, 0) + 1
+        for label, query in AGREEMENTS.items():
+            if all(label_of(tweet, key) == value for key, value in query.items()):
+                key = "agree." + label
+                increments[key] = increments.get(key, 0) + 1
+    return increments
+
+
+# function that adds the stored tweets to their time buckets. Tweets without created_at (stored before we
+# stamped them) are not part of any bucket
+def increase_rollups(tweets):
+    global collection
+    buckets = {}  # (keyword, unit, start) => the tweets of this bucket
+    for tweet in tweets:
+        if "created_at" not in tweet:
+            continue
+        keywords = [ROLLUP_ALL_KEYWORDS] + tweet.get("keywords", [])
+        for unit in ROLLUP_UNITS:
+            start = bucket_start(tweet["created_at"], unit)
+            for keyword in keywords:
+                buckets.setdefault((keyword, unit, start), []).append(tweet)
+    if len(buckets) == 0:
+        return
+    updates = [({"collection": collection.name, "keyword": keyword, "unit": unit, "start": start},
+                label_increments(bucket_tweets))
+               for (keyword, unit, start), bucket_tweets in buckets.items()]
+    increase_documents(collection.database[ROLLUPS_COLLECTION], updates)
+
+
+# function that applies a list of (query, increments) to the documents of a collection in one bulk write. Every
+# document gets the $inc of its increments, the documents that don't exist yet are created
+def increase_documents(target, updates):
+    target.bulk_write([UpdateOne(query, {"$inc": increments}, upsert=True) for query, increments in updates],
+                      ordered=False)
+
+
+# returns the start of the minute, hour or day that the given time belongs to
+def bucket_start(time_value, unit):
+    time_value = time_value.replace(second=0, microsecond=0)
+    if unit == "hour" or unit == "day":
+        time_value = time_value.replace(minute=0)
+    if unit == "day":
+        time_value = time_value.replace(hour=0)
+    return time_value
+
+
+# function that returns the buckets of the active collection for a unit ("minute", "hour" or "day"), from the
+# oldest to the newest. Every bucket looks like a counters document, with a "start" datetime (UTC).
+# If keyword is None, the buckets of all tweets are returned. It only reads the buckets that exist, the buckets of
+# the tweets stored before we kept them are built by rebuild_counters
+def sentiment_trend(unit="hour", since=None, keyword=None):
+    global collection
+    query = {"collection": collection.name, "unit": unit,
+             "keyword": ROLLUP_ALL_KEYWORDS if keyword is None else keyword}
+    if since is not None:
+        query["start"] = {"$gte": since}
+    return list(collection.database[ROLLUPS_COLLECTION].find(query).sort("start", ASCENDING))
+
+
+# function that returns a cursor over the tweets of the active collection that the analyzers agree on for a label
+# (see AGREEMENTS), with only the given fields. The server sends batch_size tweets at a time, so a loop over the
+# cursor never holds more than one batch in memory. limit is the most tweets to return, or None for all of them
+def agreed_tweets(label, fields, batch_size=1000, limit=None):
+    global collection
+    cursor = collection.find(AGREEMENTS[label], projection=fields, batch_size=batch_size)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+# returns the value of a field like "textblob.polarity" of a tweet
+def label_of(tweet, key):
+    analyzer, field = key.split(".")
+    return tweet.get(analyzer, {}).get(field)
+
+
+# function that counts the active collection from scratch with sentiment_summary and replaces its counters
+# document, and builds its rollups again. Tweets stored while this runs may be missed or counted twice, so only
+# the "Rebuild counters" button of the stats runs it, never a screen or a chart that reads the counters
+def rebuild_counters():
+    global collection
+    rebuild_rollups()
+    summary = sentiment_summary()
+    counters = dict(summary)
+    counters["_id"] = collection.name
+    counters[COUNTERS_COMPLETE] = True
+    collection.database[COUNTERS_COLLECTION].replace_one({"_id": collection.name}, counters, upsert=True)
+    read_write.log_message("[INFO]" + LOG_NAME + "Counters of '" + collection.name + "' rebuilt: " +
+                           str(summary["total"]) + " tweets")
+    return summary
+
+
+# function that deletes the rollups of the active collection and adds all its stamped tweets to them again.
+# The tweets are read with a cursor and added batch_size at a time, like the stream adds them
+def rebuild_rollups(batch_size=1000):
+    global collection
+    collection.database[ROLLUPS_COLLECTION].delete_many({"collection": collection.name})
+    fields = {"created_at": True, "keywords": True}
+    for analyzer, _, _ in SENTIMENT_FIELDS:
+        fields[analyzer] = True
+    batch = []
+    for tweet in collection.find({"created_at": {"$exists": True}}, projection=fields, batch_size=batch_size):
+        batch.append(tweet)
+        if len(batch) >= batch_size:
+            increase_rollups(batch)
+            batch = []
+    increase_rollups(batch)
+
+
+# function that deletes the counters document and the rollups of a collection, when the collection is dropped
+def drop_counters(database, name):
+    global client
+    client[database][COUNTERS_COLLECTION].delete_one({"_id": name})
+    client[database][ROLLUPS_COLLECTION].delete_many({"collection": name})
+
+
+# function that creates the SENTIMENT_INDEXES on the active collection (or on the given one), if they don't exist
+# already. If background is None, we build them in the background only for large collections.
+# Indexes only make the queries faster, so if we can't create them we log it and continue without them
+def ensure_indexes(background=None, active_collection=None):
+    global collection
+    if active_collection is None:
+        active_collection = collection
+    try:
+        if background is None:
+            background = active_collection.estimated_document_count() > BACKGROUND_INDEX_THRESHOLD
+        indexes = [IndexModel(keys, background=background) for keys in SENTIMENT_INDEXES]
+        names = active_collection.create_indexes(indexes)
+        # the rollups are found by the collection, the keyword, the unit and the start of the bucket
+        names += active_collection.database[ROLLUPS_COLLECTION].create_indexes([
+            IndexModel([("collection", ASCENDING), ("keyword", ASCENDING), ("unit", ASCENDING),
+                        ("start", ASCENDING)], unique=True, background=background)])
+        read_write.log_message("[INFO]" + LOG_NAME + "Indexes ensured on " + active_collection.name + ": " +
+                               ", ".join(names) + (" (building in the background)" if background else ""))
+        return True
+    except PyMongoError as e:
+        message = "[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e)
+        print(message)
+        read_write.log_message(message)
+        return False
+
+
+# function that runs ensure_indexes for the active collection in a daemon thread, so the GUI doesn't freeze while
+# MongoDB counts the tweets and checks (or creates) the indexes. ensure_indexes logs how it went
+def ensure_indexes_in_thread():
+    global collection
+    thread = threading.Thread(target=ensure_indexes, kwargs={"active_collection": collection}, name="IndexBuilder",
+                              daemon=True)
+    thread.start()
+    return thread
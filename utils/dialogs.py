@@ -0,0 +1,31 @@
+##########################################################################################################
+# Module that shows messages to the user. The GUI shows them in message boxes, but a headless process    #
+# (like utils.ingest) has no display, so it calls set_headless() and the messages are printed and logged #
+##########################################################################################################
+from utils import read_write
+
+LOG_NAME = " (dialogs) : "
+
+headless = False
+
+
+def set_headless(value=True):
+    global headless
+    headless = value
+
+
+def show_error(title, message):
+    if headless:
+        print("[ERROR] " + title + ": " + message)
+        read_write.log_message("[ERROR]" + LOG_NAME + title + ": " + message)
+        return
+    from tkinter import messagebox  # imported only here, so that headless processes never import tkinter
+    messagebox.showerror(title, message)
+
+
+def show_info(title, message):
+    if headless:
+        print("[INFO] " + title + ": " + message)
+        return
+    from tkinter import messagebox
+    messagebox.showinfo(title, message)
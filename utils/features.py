@@ -0,0 +1,133 @@
+##########################################################################################################
+# Module that keeps the features of the training corpora. They are extracted once, in parallel by a     #
+# pool of processes, into a FeatureMatrix (which words every document has) that is cached on disk in    #
+# files/features. The name of a cache file has a key of the corpus, the parameters and the version of    #
+# the preprocessing, so a retraining with the same data doesn't read or tokenize the corpus again.       #
+##########################################################################################################
+from utils import read_write, vocabulary, processes
+import hashlib
+import json
+import os
+import sys
+try:
+    import numpy
+except ImportError as e:
+    read_write.log_message("[FATAL] (features) : ImportError: " + str(e))
+    sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
+
+LOG_NAME = " (features) : "
+
+# increase it every time the preprocessing of the training changes the words of a document (e.g. bag_of_words),
+# so that the old cache files are not used anymore
+PREPROCESSING_VERSION = 1
+CACHE_FOLDER = "files/features"
+
+EXTRACTION_PROCESSES = os.cpu_count() or 1
+EXTRACTION_CHUNK_SIZE = 50  # documents that a process gets at once
+
+
+# Class that holds which words every document has, as a sparse boolean matrix (documents x words) in the CSR
+# layout: the word numbers of document d are indices[offsets[d]:offsets[d + 1]]. Every document has a label
+class FeatureMatrix(object):
+    def __init__(self, words, indices, offsets, labels):
+        self.words = list(words)
+        self.indices = numpy.asarray(indices, dtype=numpy.int32)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.labels = list(labels)
+
+    # builds the matrix of a list of documents, every one a list of its distinct words, and their labels.
+    # words gives the first words of the matrix in order, e.g. a vocabulary that some documents may not have
+    @classmethod
+    def from_documents(cls, documents, labels, words=()):
+        numbers = {word: number for number, word in enumerate(words)}
+        indices = []
+        offsets = [0]
+        for words in documents:
+            for word in words:
+                indices.append(numbers.setdefault(word, len(numbers)))
+            offsets.append(len(indices))
+        words = [None] * len(numbers)
+        for word, number in numbers.items():
+            words[number] = word
+        return cls(words, indices, offsets, labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    # returns the word numbers of a document
+    def word_numbers(self, document):
+        return self.indices[self.offsets[document]:self.offsets[document + 1]]
+
+    # returns the words of a document
+    def words_of(self, document):
+        return [self.words[number] for number in self.word_numbers(document)]
+
+    # returns for every word, in how many of the given documents it is found
+    def document_counts(self, documents):
+        selected = numpy.zeros(len(self), dtype=bool)
+        selected[numpy.asarray(documents, dtype=numpy.int64)] = True
+        document_of = numpy.repeat(numpy.arange(len(self)), numpy.diff(self.offsets))
+        return numpy.bincount(self.indices[selected[document_of]], minlength=len(self.words))
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder != "":
+            os.makedirs(folder, exist_ok=True)
+        temporary_path = path + ".tmp.npz"  # numpy adds .npz, if the name doesn't end with it
+        numpy.savez(temporary_path, words=numpy.array(self.words, dtype=str), indices=self.indices,
+                    offsets=self.offsets, labels=numpy.array(self.labels, dtype=str))
+        os.replace(temporary_path, path)  # so an interrupted save never leaves half a cache file
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as data:
+            return cls(data["words"].tolist(), data["indices"], data["offsets"], data["labels"].tolist())
+
+
+# returns the key of the cache file of a corpus: a hash of the parameters and everything the preprocessing uses
+def cache_key(*parameters):
+    preprocessing = [PREPROCESSING_VERSION, sorted(vocabulary.training_stops), sorted(vocabulary.digits)]
+    content = json.dumps([preprocessing, parameters], sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+# function that returns the FeatureMatrix of the cache file of name and the parameters, or builds it with
+# build() and saves it in the cache, if there isn't one
+def cached_matrix(name, parameters, build):
+    path = os.path.join(CACHE_FOLDER, name + "-" + cache_key(name, *parameters) + ".npz")
+    if os.path.exists(path):
+        try:
+            matrix = FeatureMatrix.load(path)
+            read_write.log_message("[INFO]" + LOG_NAME + "Features of " + str(len(matrix)) + " documents read from " +
+                                   path)
+            return matrix
+        except (OSError, ValueError, KeyError) as e:  # a broken file, we build it again
+            read_write.log_message("[WARN]" + LOG_NAME + type(e).__name__ + ": " + str(e))
+    matrix = build()
+    try:
+        matrix.save(path)
+        read_write.log_message("[INFO]" + LOG_NAME + "Features of " + str(len(matrix)) + " documents saved in " +
+                               path)
+    except OSError as e:  # we can still train, only the next training will extract them again
+        read_write.log_message("[ERROR]" + LOG_NAME + "OSError: " + str(e))
+    return matrix
+
+
+# function that runs function for every item in a pool of EXTRACTION_PROCESSES processes and returns the results
+# in the same order. function must be a module-level function, so that the processes can import it (they don't
+# fork from the program, see processes.create_pool).
+# progress, if given, is called with 1 for every finished item. If it raises, the pool is terminated
+def parallel_map(function, items, progress=None):
+    results = []
+    if EXTRACTION_PROCESSES <= 1 or len(items) <= EXTRACTION_CHUNK_SIZE:
+        for item in items:
+            results.append(function(item))
+            if progress is not None:
+                progress(1)
+        return results
+    with processes.create_pool(EXTRACTION_PROCESSES) as pool:
+        for result in pool.imap(function, items, chunksize=EXTRACTION_CHUNK_SIZE):
+            results.append(result)
+            if progress is not None:
+                progress(1)
+    return results
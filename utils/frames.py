@@ -9,17 +9,29 @@ import os
 
 LOG_NAME = " (frames) : "
 
+TRAINING_POLL_INTERVAL = 500  # milliseconds between two reads of the training progress
+
+
+# returns the seconds as minutes:seconds, e.g. 02:05
+def elapsed_text(seconds):
+    return "%02d:%02d" % divmod(int(seconds), 60)
+
 
 # Frame responsible to show the main menu of the Application. It has 5 buttons. If user press "Stream"
 # the StreamFrame will show up. If "Search" is pressed, SearchFrame. With "Show Stats", StatsFrame, with
-# "Back", DbFrame will show and with "Exit", Application closes
+# "Back", DbFrame will show and with "Exit", Application closes. "Start Training" trains the classifiers in
+# the background (see training.TrainingController), while this frame shows the progress under the buttons.
+# "Train on Tweets" trains them on the tweets of the active collection that the analyzers agree on
 class MainFrame(Frame):
     def __init__(self, master):
         super(MainFrame, self).__init__(master)
         self.root = master
+        self.poll_id = None  # the after() call that reads the training progress next
+        self.watching = False  # True if this frame saw the training running, so it tells the user how it ended
 
         # build the widgets
-        self.training_btn = Button(self, text="Start Training", width=30, command=training.start_training)
+        self.training_btn = Button(self, text="Start Training", width=30, command=self.start_training)
+        self.tweets_training_btn = Button(self, text="Train on Tweets", width=30, command=self.start_tweets_training)
         self.stream_btn = Button(self, text="Start Stream", width=30)
         self.stats_btn = Button(self, text="Show Stats", width=30)
         self.back_btn = Button(self, text="Back", width=30)
@@ -27,10 +39,86 @@ class MainFrame(Frame):
 
         # add the widgets
         self.training_btn.grid(row=0, column=2, columnspan=2, pady=10, ipady=3)
-        self.stream_btn.grid(row=1, column=2, columnspan=2, pady=10, ipady=3)
-        self.stats_btn.grid(row=2, column=2, columnspan=2, pady=10, ipady=3)
-        self.back_btn.grid(row=3, column=2, columnspan=2, pady=10, ipady=3)
-        self.exit_btn.grid(row=4, column=2, columnspan=2, pady=10, ipady=3)
+        self.tweets_training_btn.grid(row=1, column=2, columnspan=2, pady=10, ipady=3)
+        self.stream_btn.grid(row=2, column=2, columnspan=2, pady=10, ipady=3)
+        self.stats_btn.grid(row=3, column=2, columnspan=2, pady=10, ipady=3)
+        self.back_btn.grid(row=4, column=2, columnspan=2, pady=10, ipady=3)
+        self.exit_btn.grid(row=5, column=2, columnspan=2, pady=10, ipady=3)
+        self.training_lbl = Label(self, text="")
+        self.training_lbl.grid(row=6, column=2, columnspan=2, pady=5)
+
+        # a training may run from before the user left the main menu
+        if training.training_controller.is_running():
+            self.watching = True
+            self.poll_training()
+
+    # this method starts the training of the missing classifiers, or of both if the user wants to train them again
+    def start_training(self):
+        models = training.missing_models()
+        if len(models) == 0:
+            message = "Both classifiers exist already. Train them again?\n"
+            message += "A running stream keeps using the current ones until the new ones are saved."
+            if not messagebox.askyesno(title="Training", message=message, icon="question", parent=self.root):
+                return
+            models = ["polarity", "subjectivity"]
+        if training.training_controller.start(models):
+            self.watching = True
+        self.poll_training()
+
+    # this method trains both classifiers again, on the tweets of the active collection that the analyzers agree on
+    def start_tweets_training(self):
+        message = "Train both classifiers on the tweets of this collection that the analyzers agree on?\n"
+        message += "A running stream keeps using the current ones until the new ones are saved."
+        if not messagebox.askyesno(title="Training", message=message, icon="question", parent=self.root):
+            return
+        if training.training_controller.start(["tweets_polarity", "tweets_subjectivity"]):
+            self.watching = True
+        self.poll_training()
+
+    def cancel_training(self):
+        x = messagebox.askyesno(title="Training", message="Are you sure you want to cancel the training?",
+                                icon="question", parent=self.root)
+        if x:
+            training.training_controller.cancel()
+            self.poll_training()
+
+    # this method shows the progress of the training and calls itself again with after(), until the training ends
+    def poll_training(self):
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+        progress = training.training_controller.progress()
+        if progress["running"]:
+            text = progress["phase"]
+            if progress["total_documents"] > 0:
+                text += " - " + str(progress["documents"]) + "/" + str(progress["total_documents"]) + " documents"
+            text += " - " + elapsed_text(progress["elapsed"])
+            if progress["cancelling"]:
+                text += "\nCancelling..."
+            self.training_lbl.config(text=text)
+            self.training_btn.config(text="Cancel Training", command=self.cancel_training)
+            self.tweets_training_btn.config(state="disabled")
+            self.poll_id = self.after(TRAINING_POLL_INTERVAL, self.poll_training)
+            return
+
+        self.training_btn.config(text="Start Training", command=self.start_training)
+        self.tweets_training_btn.config(state="normal")
+        if progress["result"] is None:
+            return
+        self.training_lbl.config(text=progress["message"] + " (" + elapsed_text(progress["elapsed"]) + ")")
+        if self.watching:
+            self.watching = False
+            if progress["result"] == "failed":
+                messagebox.showerror("Training", progress["message"], parent=self.root)
+            else:
+                messagebox.showinfo("Training", progress["message"], parent=self.root)
+
+    # the frame is destroyed when the user leaves the main menu. The training goes on, but nobody polls it
+    def destroy(self):
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+        super(MainFrame, self).destroy()
 
 
 # Frame that let the user choose a host and make a successful connection to a database. If succeed
@@ -200,6 +288,9 @@ class DbFrame(Frame):
         # only if a database name already exists
         if self.db_entry.get() is not "":
             collection_list = self.client[self.db_entry.get()].collection_names(include_system_collections=False)
+            # the counters and the rollups of the collections are not tweets, so the user can't pick them
+            collection_list = [name for name in collection_list
+                               if name not in (db_utils.COUNTERS_COLLECTION, db_utils.ROLLUPS_COLLECTION)]
 
         collection_counter = 0  # this counter is responsible to place the radio-buttons into correct row
         for name in collection_list:
@@ -284,6 +375,7 @@ class DbFrame(Frame):
             db_name = self.db_entry.get()
             try:
                 self.client[db_name].drop_collection(name)
+                db_utils.drop_counters(db_name, name)
             except ServerSelectionTimeoutError as e:
                 read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
                 messagebox.showerror("Error", "Lost Connection to the DB")
@@ -414,7 +506,9 @@ class StatsFrame(Frame):
         self.root = master
         self.collection = db_utils.get_collection()
 
-        self.all_documents = self.collection.find()  # this is a Cursor object
+        # all the counts we show, read from the counters of the collection that the charts use too. They are None
+        # if the counters are not complete, then the user can count the collection with "Rebuild counters"
+        self.summary = db_utils.read_counters()
 
         self.quick_facts_frm = Frame(self)
         self.quick_facts_frm.grid(row=0, column=0, pady=5)
@@ -425,11 +519,17 @@ class StatsFrame(Frame):
         exit_frm = Frame(self)
         exit_frm.grid(row=3, column=0, pady=5)
 
-        tweets_sum = self.all_documents.count()
-        read_write.log_message("[INFO] (frames.StatsFrame) : Found " + str(tweets_sum) + " tweets in the DB")
+        tweets_sum = 0 if self.summary is None else self.summary["total"]
+        if self.summary is not None:
+            read_write.log_message("[INFO] (frames.StatsFrame) : Found " + str(tweets_sum) + " tweets in the DB")
 
+        if self.summary is None:  # the collection has tweets stored before we kept counters
+            message = "The counters of this collection are not complete."
+            read_write.log_message("[WARN] (frames.StatsFrame) : " + message)
+            message += "\nPress 'Rebuild counters' to count its tweets. This may take a while."
+            Label(self.quick_facts_frm, text=message).grid(row=0, column=0, padx=10, pady=5)
         # if we use a collection with no stored tweets, we do not show any data or metric
-        if tweets_sum > 0:
+        elif tweets_sum > 0:
             Label(self.quick_facts_frm, text="Textblob").grid(row=2, column=0, padx=2, pady=2)
             Label(self.quick_facts_frm, text="VADER").grid(row=3, column=0, padx=2, pady=2)
             Label(self.quick_facts_frm, text="NLTK").grid(row=4, column=0, padx=2, pady=2)
@@ -439,54 +539,50 @@ class StatsFrame(Frame):
             Label(self.quick_facts_frm, text="Subjective").grid(row=1, column=4, padx=6, pady=2)
             Label(self.quick_facts_frm, text="Objective").grid(row=1, column=5, padx=6, pady=2)
 
-            number_of_textblob_positive = self.collection.find({"textblob.polarity": 'pos'}).count()
+            number_of_textblob_positive = self.summary["textblob"]["polarity"]["pos"]
             Label(self.quick_facts_frm, text=str(number_of_textblob_positive)).grid(row=2, column=1, pady=2)
 
-            number_of_textblob_neutral = self.collection.find({"textblob.polarity": 'neu'}).count()
+            number_of_textblob_neutral = self.summary["textblob"]["polarity"]["neu"]
             Label(self.quick_facts_frm, text=str(number_of_textblob_neutral)).grid(row=2, column=2, pady=2)
 
-            number_of_textblob_negative = self.collection.find({"textblob.polarity": 'neg'}).count()
+            number_of_textblob_negative = self.summary["textblob"]["polarity"]["neg"]
             Label(self.quick_facts_frm, text=str(number_of_textblob_negative)).grid(row=2, column=3, pady=2)
 
-            number_of_textblob_subjective = self.collection.find({"textblob.subjectivity": 'subj'}).count()
+            number_of_textblob_subjective = self.summary["textblob"]["subjectivity"]["subj"]
             Label(self.quick_facts_frm, text=str(number_of_textblob_subjective)).grid(row=2, column=4, pady=2)
 
-            number_of_textblob_objective = self.collection.find({"textblob.subjectivity": 'obj'}).count()
+            number_of_textblob_objective = self.summary["textblob"]["subjectivity"]["obj"]
             Label(self.quick_facts_frm, text=str(number_of_textblob_objective)).grid(row=2, column=5, pady=2)
 
-            number_of_vader_positive = self.collection.find({"vader.polarity": 'pos'}).count()
+            number_of_vader_positive = self.summary["vader"]["polarity"]["pos"]
             Label(self.quick_facts_frm, text=str(number_of_vader_positive)).grid(row=3, column=1, pady=2)
 
-            number_of_vader_neutral = self.collection.find({"vader.polarity": 'neu'}).count()
+            number_of_vader_neutral = self.summary["vader"]["polarity"]["neu"]
             Label(self.quick_facts_frm, text=str(number_of_vader_neutral)).grid(row=3, column=2, pady=2)
 
-            number_of_vader_negative = self.collection.find({"vader.polarity": 'neg'}).count()
+            number_of_vader_negative = self.summary["vader"]["polarity"]["neg"]
             Label(self.quick_facts_frm, text=str(number_of_vader_negative)).grid(row=3, column=3, pady=2)
 
-            number_of_training_positive = self.collection.find({"training.polarity": 'pos'}).count()
+            number_of_training_positive = self.summary["training"]["polarity"]["pos"]
             Label(self.quick_facts_frm, text=str(number_of_training_positive)).grid(row=4, column=1, pady=2)
 
-            number_of_training_negative = self.collection.find({"training.polarity": 'neg'}).count()
+            number_of_training_negative = self.summary["training"]["polarity"]["neg"]
             Label(self.quick_facts_frm, text=str(number_of_training_negative)).grid(row=4, column=3, pady=2)
 
-            number_of_training_subjective = self.collection.find({"training.subjectivity": 'subj'}).count()
+            number_of_training_subjective = self.summary["training"]["subjectivity"]["subj"]
             Label(self.quick_facts_frm, text=str(number_of_training_subjective)).grid(row=4, column=4, pady=2)
 
-            number_of_training_objective = self.collection.find({"training.subjectivity": 'obj'}).count()
+            number_of_training_objective = self.summary["training"]["subjectivity"]["obj"]
             Label(self.quick_facts_frm, text=str(number_of_training_objective)).grid(row=4, column=5, pady=2)
 
             Label(self.compare_frm, text="Total unique tweets stored:").grid(row=1, column=0, padx=2, pady=2, sticky=W)
             Label(self.compare_frm, text=str(tweets_sum)).grid(row=1, column=1, pady=2)
 
-            all_pos_counter = self.collection.find({"textblob.polarity": 'pos', "vader.polarity": 'pos',
-                                                "training.polarity": 'pos'}).count()
-            all_neg_counter = self.collection.find({"textblob.polarity": 'neg', "vader.polarity": 'neg',
-                                                "training.polarity": 'neg'}).count()
-            all_neu_counter = self.collection.find({"textblob.polarity": 'neu', "vader.polarity": 'neu'}).count()
-            all_subj_counter = self.collection.find({"textblob.subjectivity": 'subj',
-                                                 "training.subjectivity": 'subj'}).count()
-            all_obj_counter = self.collection.find({"textblob.subjectivity": 'obj',
-                                                    "training.subjectivity": 'obj'}).count()
+            all_pos_counter = self.summary["agree"]["pos"]
+            all_neg_counter = self.summary["agree"]["neg"]
+            all_neu_counter = self.summary["agree"]["neu"]
+            all_subj_counter = self.summary["agree"]["subj"]
+            all_obj_counter = self.summary["agree"]["obj"]
 
             Label(self.compare_frm, text="Positive tweets that agree: ").grid(row=2, column=0, padx=2, pady=2, sticky=W)
             Label(self.compare_frm, text=str(round((all_pos_counter/tweets_sum)*100, 1))+"%").grid(row=2, column=1,
@@ -539,6 +635,11 @@ class StatsFrame(Frame):
             self.training_subjectivity_btn = Button(show_graphs_frm, text="NLTK Subjectivity Pie chart",
                                                 command=chart_utils.show_training_subjectivity)
             self.training_subjectivity_btn.grid(row=4, column=1, pady=10, ipadx=5)
+
+            # polarity of all analyzers over time
+            self.polarity_trend_btn = Button(show_graphs_frm, text="Polarity over time",
+                                             command=chart_utils.show_polarity_trend)
+            self.polarity_trend_btn.grid(row=5, column=1, pady=10, ipadx=5)
         else:  # if we have an empty collection
             message = "No documents found in this collection."
             read_write.log_message("[WARN] (frames.StatsFrame) : " + message)
@@ -548,9 +649,26 @@ class StatsFrame(Frame):
         # Build the widgets for exit_frm
         self.back_btn = Button(exit_frm, text="Back")
         self.back_btn.grid(row=0, column=1, ipadx=5, ipady=3, pady=15)
+        self.rebuild_btn = Button(exit_frm, text="Rebuild counters", command=self.rebuild_counters)
+        self.rebuild_btn.grid(row=0, column=2, ipadx=5, ipady=3, padx=15, pady=15)
         self.exit_btn = Button(exit_frm, text="Exit", command=self.safe_exit)
         self.exit_btn.grid(row=0, column=3, ipadx=5, ipady=3, padx=15, pady=10)
 
+    # this method counts the whole collection again, in case the counters went wrong (e.g. after a crash)
+    def rebuild_counters(self):
+        try:
+            summary = db_utils.rebuild_counters()
+        except ServerSelectionTimeoutError as e:
+            read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
+            messagebox.showerror("Error", "Lost Connection to the DB")
+            return
+        except AutoReconnect as e:
+            read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
+            messagebox.showerror("Error", "Lost Connection to the DB")
+            return
+        messagebox.showinfo("Counters", "Counters rebuilt for " + str(summary["total"]) + " tweets.\n" +
+                            "Go back and open the stats again to see them.", parent=self.root)
+
     def safe_exit(self):
         x = messagebox.askyesno(title="Exit", message="Are you sure you want to exit?",
                                 icon="question")
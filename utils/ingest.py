@@ -0,0 +1,107 @@
+############################################################################################################
+# Headless entry point that gathers tweets into MongoDB without the GUI, so it can run on servers.        #
+# Example: python -m utils.ingest --host localhost --port 27017 --db twitter --collection tweets           #
+#          --track "python,mongodb"                                                                        #
+############################################################################################################
+from utils import read_write, db_utils, stream_util, work_queue, dialogs, metrics, sentiment_utils
+import argparse
+import sys
+import time
+
+LOG_NAME = " (ingest) : "
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.ingest",
+                                     description="Gather tweets for some keywords and store them in MongoDB.")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--track", required=True, help="comma separated keywords, e.g. kw1,kw2")
+    return parser.parse_args(arguments)
+
+
+# adds the arguments of the database, that every headless entry point needs (see select_collection)
+def add_database_arguments(parser):
+    parser.add_argument("--host", default="localhost", help="MongoDB host (default: localhost)")
+    parser.add_argument("--port", default=27017, type=int, help="MongoDB port (default: 27017)")
+    parser.add_argument("--db", required=True, help="database of the tweets")
+    parser.add_argument("--collection", required=True, help="collection of the tweets")
+
+
+# adds the arguments of the database and the workers, that every entry point that stores tweets needs
+def add_pipeline_arguments(parser):
+    add_database_arguments(parser)
+    parser.add_argument("--workers", default=stream_util.WORKERS, type=int,
+                        help="threads that format and store the tweets (default: %(default)s)")
+    parser.add_argument("--queue-size", default=stream_util.QUEUE_SIZE, type=int,
+                        help="raw tweets that can wait for the workers (default: %(default)s)")
+    parser.add_argument("--queue-policy", default=stream_util.QUEUE_POLICY, choices=work_queue.POLICIES,
+                        help="what to do when the queue is full (default: %(default)s)")
+    parser.add_argument("--spill-path", default=None,
+                        help="file of the tweets spilled by the spill policy (default: files/spill-PID-N.jsonl, "
+                             "one for every process)")
+    parser.add_argument("--metrics-port", default=None, type=int,
+                        help="serve the metrics in the Prometheus format at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--log-level", default=None, choices=["INFO", "WARN", "ERROR"],
+                        help="lowest level of the messages written to the log (default: $SA_LOG_LEVEL or INFO)")
+
+
+# function that connects to MongoDB and selects the database and the collection of the options.
+# Exits if we can't connect
+def select_collection(options):
+    response = db_utils.can_connect(options.host, options.port)
+    if not response["connect"]:
+        sys.exit("[SEVERE] Can't connect to MongoDB: " + response["errors"])
+    active_database = db_utils.get_client()[options.db]
+    db_utils.set_database(active_database)
+    db_utils.set_collection(active_database[options.collection])
+    db_utils.start_counters()
+    db_utils.ensure_indexes()
+    read_write.log_message("[INFO]" + LOG_NAME + "Using database: '" + options.db + "' - collection: '" +
+                           options.collection + "'")
+
+
+# function that starts the metrics endpoint, if the options have a --metrics-port. Exits if the port is in use
+def serve_metrics(options):
+    if options.metrics_port is None:
+        return
+    try:
+        metrics.serve(options.metrics_port)
+    except OSError as e:
+        read_write.log_message("[FATAL]" + LOG_NAME + "OSError: " + str(e))
+        sys.exit("[SEVERE] Can't serve the metrics at port " + str(options.metrics_port) + ": " + str(e))
+
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    dialogs.set_headless()  # there is no display, so errors are only printed and logged
+    if options.log_level is not None:
+        read_write.set_log_level(options.log_level)
+    read_write.log_message("[INFO]" + LOG_NAME + "Headless ingest starts")
+    select_collection(options)
+    serve_metrics(options)
+
+    # the listener reads the keywords from the module's controller, so we replace it with ours
+    controller = stream_util.StreamController(workers=options.workers, queue_size=options.queue_size,
+                                              queue_policy=options.queue_policy, spill_path=options.spill_path)
+    stream_util.stream_controller = controller
+    controller.search_keyword = options.track
+    controller.combine()
+
+    try:
+        while controller.is_running():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Terminating stream...")
+        read_write.log_message("[INFO]" + LOG_NAME + "Terminating stream...")
+    controller.stop()
+
+    # the workers finish what is left in the queue, before we exit
+    for worker in controller.listener.workers:
+        worker.join()
+    sentiment_utils.close_scoring_pool()
+    metrics.stop_serving()
+    read_write.log_message("[INFO]" + LOG_NAME + "Headless ingest stopped")
+
+
+if __name__ == '__main__':
+    main()
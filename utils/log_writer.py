@@ -0,0 +1,210 @@
+#########################################################################################################
+# Module that writes the log files. A message is only put in a buffer in memory and a background        #
+# thread writes the buffer to the file every FLUSH_INTERVAL seconds, with one write. Messages are       #
+# filtered by their level (e.g. [INFO] can be suppressed with SA_LOG_LEVEL=WARN) and a new file starts  #
+# when the current one is larger than MAX_BYTES or older than MAX_AGE. Only the newest MAX_FILES of the #
+# files that the writer named (sa_<date>_<time>.log) stay, any other file in the folder is kept, and so #
+# is every file written in the last MAX_AGE, because another running process may be writing it.         #
+#########################################################################################################
+import atexit
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+# the level of every tag that the messages start with. Messages without a tag are always written
+LEVELS = {"DEBUG": 10,
+          "INFO": 20, "SUCCESS": 20, "METRICS": 20,
+          "WARN": 30,
+          "ERROR": 40, "HTTP_ERROR": 40,
+          "SEVERE": 50, "FATAL": 50}
+LEVEL = os.environ.get("SA_LOG_LEVEL", "INFO")  # messages below this level are not written
+DEFAULT_LEVEL = "INFO"  # the level we use, if LEVEL is not one of LEVELS
+URGENT_LEVEL = 40  # messages of this level or higher are written at once, not after FLUSH_INTERVAL
+
+FLUSH_INTERVAL = 1.0  # seconds
+FLUSH_SIZE = 200  # lines in the buffer, that wake the writer before FLUSH_INTERVAL passes
+MAX_BUFFER = 10000  # if the disk can't keep up, lines over this are dropped (and counted)
+MAX_BYTES = 10 * 1024 * 1024
+MAX_AGE = 24 * 60 * 60  # seconds
+MAX_FILES = 30
+
+FILE_PREFIX = "sa_"
+
+tag_regex = re.compile(r"^\s*\[([A-Z_]+)\]")
+# the names of the files that file_name_of and a rotation give, the only ones that remove_old_files deletes
+file_name_regex = re.compile(r"^" + FILE_PREFIX + r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(-\d+)?\.log$")
+
+
+# returns the name of a new log file, e.g. sa_2018-09-12_18-03-32.log
+def file_name_of(moment):
+    return FILE_PREFIX + str(moment.replace(microsecond=0)).replace(' ', '_').replace(':', '-') + ".log"
+
+
+# returns the level of a message by its tag, or None if it has no known tag
+def level_of(message):
+    match = tag_regex.match(message)
+    if match is None:
+        return None
+    return LEVELS.get(match.group(1))
+
+
+class LogWriter(object):
+    def __init__(self, directory, file_name, level=LEVEL):
+        self.directory = directory
+        self.path = os.path.join(directory, file_name)
+        self.opened_time = None
+        self.reset()
+        if level.upper() in LEVELS:
+            self.level = LEVELS[level.upper()]
+        else:  # a typo in SA_LOG_LEVEL shouldn't stop the program
+            self.level = LEVELS[DEFAULT_LEVEL]
+            message = "[WARN] (log_writer) : Unknown log level '" + level + "', using " + DEFAULT_LEVEL
+            print(message)
+            self.write(message)
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):  # Python 3.7+
+            os.register_at_fork(after_in_child=self.reset)
+
+    # method that gives the writer new locks, an empty buffer and no thread. A forked process runs it first:
+    # another thread of the parent may have held a lock at the moment of the fork, that nobody would release
+    def reset(self):
+        self.lines = []
+        self.dropped = 0  # lines that didn't fit in the buffer
+        self.buffer_lock = threading.Condition()
+        self.file_lock = threading.Lock()  # only one thread writes the file at a time, so lines keep their order
+        self.start_lock = threading.Lock()
+        self.log_file = None  # after a fork, the file object is the parent's
+        self.thread = None
+        self.pid = None  # the process that started the thread. A forked process has to start its own
+        self.closing = False
+        self.urgent = False  # True when a message must be written without waiting for FLUSH_INTERVAL
+
+    def set_level(self, level):
+        self.level = LEVELS[level.upper()]
+
+    # method that puts a message in the buffer, with the time it was logged, if its level is enabled
+    def write(self, message):
+        level = level_of(message)
+        if level is not None and level < self.level:
+            return
+        line = str(datetime.now().replace(microsecond=0)) + " >> " + message + "\n"
+        if self.pid is not None and self.pid != os.getpid():  # forked on a Python without os.register_at_fork
+            self.reset()
+        if self.pid is None:
+            self.start()
+        with self.buffer_lock:
+            if len(self.lines) >= MAX_BUFFER:
+                self.dropped += 1
+                return
+            self.lines.append(line)
+            if level is not None and level >= URGENT_LEVEL:
+                self.urgent = True
+            if self.urgent or len(self.lines) >= FLUSH_SIZE:
+                self.buffer_lock.notify()
+
+    # starts the writer thread of this process, if another thread didn't start it already
+    def start(self):
+        with self.start_lock:
+            if self.pid is not None:
+                return
+            self.closing = False
+            self.thread = threading.Thread(target=self.run, name="LogWriter", daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    # the loop of the writer thread
+    def run(self):
+        while True:
+            with self.buffer_lock:
+                if not self.closing and not self.urgent and len(self.lines) < FLUSH_SIZE:
+                    self.buffer_lock.wait(FLUSH_INTERVAL)
+                self.urgent = False
+                if self.closing:
+                    return
+            self.flush()
+
+    # method that writes everything the buffer has, at once. It can be called from any thread
+    def flush(self):
+        with self.file_lock:
+            with self.buffer_lock:
+                lines = self.lines
+                self.lines = []
+                dropped = self.dropped
+                self.dropped = 0
+            if dropped > 0:
+                lines.append(str(datetime.now().replace(microsecond=0)) + " >> [WARN] (log_writer) : " +
+                             str(dropped) + " log lines were dropped, the buffer was full\n")
+            if len(lines) == 0:
+                return
+            try:
+                self.rotate_if_due()
+                if self.log_file is None:
+                    if self.opened_time is None:  # the first file of the program
+                        self.remove_old_files()
+                    self.open()
+                self.log_file.write("".join(lines))
+                self.log_file.flush()
+            except OSError as e:  # we can't log that we can't log, so we only print it
+                print("[ERROR] (log_writer) : OSError: " + str(e) + " - " + str(len(lines)) + " log lines lost")
+                self.log_file = None
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # an unencodable character is escaped, instead of losing the whole line
+        self.log_file = open(self.path, "a", encoding="utf-8", errors="backslashreplace")
+        self.opened_time = time.time()
+
+    # method that starts a new file, if the current one is too large or too old. The caller holds file_lock
+    def rotate_if_due(self):
+        if self.log_file is None:
+            return
+        if self.log_file.tell() < MAX_BYTES and time.time() - self.opened_time < MAX_AGE:
+            return
+        self.log_file.close()
+        self.log_file = None
+        path = os.path.join(self.directory, file_name_of(datetime.now()))
+        number = 1
+        while os.path.exists(path):  # e.g. two rotations in the same second
+            path = os.path.join(self.directory, file_name_of(datetime.now())[:-len(".log")] + "-" + str(number) +
+                                ".log")
+            number += 1
+        self.path = path
+        self.remove_old_files()
+
+    # method that deletes the oldest log files that the writer named, so that only the newest MAX_FILES stay.
+    # The names start with their date, so sorting them by name sorts them by age. Many processes log in the
+    # same folder (e.g. headless ingests), so we keep a file written in the last MAX_AGE: its process may still
+    # have it open, and on Linux its next lines would go to a deleted file. A process whose file is older than
+    # that, starts a new file before it writes again (see rotate_if_due)
+    def remove_old_files(self):
+        if not os.path.isdir(self.directory):
+            return
+        names = sorted(name for name in os.listdir(self.directory) if file_name_regex.match(name))
+        now = time.time()
+        for name in names[:max(0, len(names) - (MAX_FILES - 1))]:  # and the new file makes MAX_FILES
+            path = os.path.join(self.directory, name)
+            try:
+                if path == self.path or now - os.path.getmtime(path) < MAX_AGE:
+                    continue
+                os.remove(path)
+            except OSError as e:
+                print("[ERROR] (log_writer) : OSError: " + str(e))
+
+    # writes what is left and stops the thread. It runs when the program exits, too
+    def close(self):
+        if self.pid != os.getpid():  # a process that never logged (e.g. forked), has nothing to write
+            return
+        with self.buffer_lock:
+            self.closing = True
+            self.buffer_lock.notify()
+        if self.thread is not None:
+            self.thread.join(FLUSH_INTERVAL * 2)
+        self.flush()
+        with self.file_lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+        with self.buffer_lock:
+            self.pid = None  # a message after close starts the thread again
@@ -0,0 +1,234 @@
+#############################################################################################################
+# Module that keeps the metrics of the pipeline: how long every stage takes (parse, clean, every analyzer, #
+# DB write), how many tweets we stored or ignored, the errors, the throughput and the depth of the queue.  #
+# They are written to the log every REPORT_INTERVAL seconds as one JSON line and, if serve() is called,    #
+# they can be read in the Prometheus text format at http://127.0.0.1:<port>/metrics                        #
+#############################################################################################################
+from utils import read_write
+from collections import deque
+from contextlib import contextmanager
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import json
+import threading
+import time
+
+LOG_NAME = " (metrics) : "
+
+PREFIX = "sentiment_"
+# upper bounds of the buckets of the stage histograms, in seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+REPORT_INTERVAL = 60  # seconds between two log lines
+THROUGHPUT_WINDOW = 60  # the throughput is the stored tweets per second in the last THROUGHPUT_WINDOW seconds
+METRICS_HOST = "127.0.0.1"  # the endpoint is local only
+
+# the counters we keep, with the name of their label and their description
+COUNTERS = {"tweets_total": ("result", "Tweets the workers stored or ignored"),
+            "errors_total": ("kind", "Errors of the stream and of the database")}
+
+# every stage holds the number of timings, their sum, the slowest one and the counts of the histogram buckets
+stages = {}
+counters = {name: {} for name in COUNTERS}
+gauges = {}  # name => (function that returns the value, description)
+stored_times = deque()  # (time, stored tweets), to compute the throughput
+metrics_lock = threading.Lock()
+
+reporter = None
+reporter_stop = None
+server = None
+
+
+# function that records how many seconds a stage took, for one tweet or one batch
+def observe(stage, seconds):
+    with metrics_lock:
+        if stage not in stages:
+            stages[stage] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(STAGE_BUCKETS)}
+        timings = stages[stage]
+        timings["count"] += 1
+        timings["sum"] += seconds
+        timings["max"] = max(timings["max"], seconds)
+        for index, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                timings["buckets"][index] += 1
+                break  # the exposition adds up the buckets, so we only count the first one that fits
+
+
+# times the block of a with statement as the given stage
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+# function that increases a counter, e.g. increase("tweets_total", "stored", 50) or increase("errors_total", "db")
+def increase(name, label, amount=1):
+    if amount == 0:
+        return
+    with metrics_lock:
+        counters[name][label] = counters[name].get(label, 0) + amount
+        if name == "tweets_total" and label == "stored":
+            stored_times.append((time.monotonic(), amount))
+
+
+# function that registers a gauge. Its value is read from function every time we report it, e.g. the queue depth
+def set_gauge(name, function, description=""):
+    with metrics_lock:
+        gauges[name] = (function, description)
+
+
+# returns the stored tweets per second, in the last THROUGHPUT_WINDOW seconds
+def throughput():
+    now = time.monotonic()
+    with metrics_lock:
+        while len(stored_times) > 0 and stored_times[0][0] < now - THROUGHPUT_WINDOW:
+            stored_times.popleft()
+        return sum(amount for _, amount in stored_times) / THROUGHPUT_WINDOW
+
+
+# returns the value of every gauge. A gauge that fails is skipped, so the report never breaks
+def gauge_values():
+    with metrics_lock:
+        registered = dict(gauges)
+    values = {}
+    for name, (function, _) in registered.items():
+        try:
+            values[name] = function()
+        except Exception as e:
+            read_write.log_message("[WARN]" + LOG_NAME + "Gauge '" + name + "' failed: " + str(repr(e)))
+    return values
+
+
+# returns all the metrics in a dictionary, the timings in milliseconds
+def snapshot():
+    current_throughput = throughput()
+    values = gauge_values()
+    with metrics_lock:
+        stage_summary = {stage: {"count": timings["count"],
+                                 "mean_ms": round(timings["sum"] / timings["count"] * 1000, 3),
+                                 "max_ms": round(timings["max"] * 1000, 3)}
+                         for stage, timings in stages.items()}
+        result = {"stages": stage_summary,
+                  "tweets": dict(counters["tweets_total"]),
+                  "errors": dict(counters["errors_total"])}
+    result["throughput"] = round(current_throughput, 2)
+    result.update(values)
+    return result
+
+
+# returns all the metrics in the Prometheus text exposition format
+def exposition():
+    current_throughput = throughput()
+    values = gauge_values()
+    with metrics_lock:
+        lines = ["# HELP " + PREFIX + "stage_seconds Seconds a stage of the pipeline took, per tweet or batch",
+                 "# TYPE " + PREFIX + "stage_seconds histogram"]
+        for stage in sorted(stages):
+            timings = stages[stage]
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS, timings["buckets"]):
+                cumulative += count
+                lines.append(PREFIX + 'stage_seconds_bucket{stage="' + stage + '",le="' + str(bound) + '"} ' +
+                             str(cumulative))
+            lines.append(PREFIX + 'stage_seconds_bucket{stage="' + stage + '",le="+Inf"} ' + str(timings["count"]))
+            lines.append(PREFIX + 'stage_seconds_sum{stage="' + stage + '"} ' + repr(timings["sum"]))
+            lines.append(PREFIX + 'stage_seconds_count{stage="' + stage + '"} ' + str(timings["count"]))
+
+        for name, (label, description) in sorted(COUNTERS.items()):
+            lines.append("# HELP " + PREFIX + name + " " + description)
+            lines.append("# TYPE " + PREFIX + name + " counter")
+            for value, count in sorted(counters[name].items()):
+                lines.append(PREFIX + name + "{" + label + '="' + value + '"} ' + str(count))
+
+        described = {name: description for name, (_, description) in gauges.items()}
+
+    lines.append("# HELP " + PREFIX + "throughput_tweets_per_second Stored tweets per second, in the last " +
+                 str(THROUGHPUT_WINDOW) + " seconds")
+    lines.append("# TYPE " + PREFIX + "throughput_tweets_per_second gauge")
+    lines.append(PREFIX + "throughput_tweets_per_second " + repr(float(current_throughput)))
+    for name in sorted(values):
+        if described.get(name):
+            lines.append("# HELP " + PREFIX + name + " " + described[name])
+        lines.append("# TYPE " + PREFIX + name + " gauge")
+        lines.append(PREFIX + name + " " + str(values[name]))
+    return "\n".join(lines) + "\n"
+
+
+# writes the snapshot of the metrics to the log, as one JSON line
+def log_metrics():
+    read_write.log_message("[METRICS]" + LOG_NAME + json.dumps(snapshot(), sort_keys=True))
+
+
+# function that starts a thread, that writes the metrics to the log every interval seconds.
+# It does nothing if the thread already runs
+def start_reporting(interval=REPORT_INTERVAL):
+    global reporter, reporter_stop
+    with metrics_lock:
+        if reporter is not None:
+            return
+        stop = threading.Event()  # every thread has its own, so a new thread can't un-set the stop of an old one
+
+        def report():
+            while not stop.wait(interval):
+                log_metrics()
+
+        thread = threading.Thread(target=report, name="MetricsReporter", daemon=True)
+        reporter = thread
+        reporter_stop = stop
+    thread.start()
+
+
+# stops the reporting thread and writes the metrics one last time
+def stop_reporting():
+    global reporter, reporter_stop
+    with metrics_lock:
+        if reporter is None:
+            return
+        reporter_stop.set()
+        reporter = None
+        reporter_stop = None
+    log_metrics()
+
+
+# the handler of the HTTP endpoint. It answers to GET /metrics only
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # the requests would be printed to stderr, we don't want them
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# function that starts the HTTP endpoint on the given port, in a new thread
+def serve(port, host=METRICS_HOST):
+    global server
+    if server is not None:
+        return server
+    server = MetricsServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    message = "[INFO]" + LOG_NAME + "Metrics endpoint: http://" + host + ":" + str(server.server_port) + "/metrics"
+    print(message)
+    read_write.log_message(message)
+    return server
+
+
+def stop_serving():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
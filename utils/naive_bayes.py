@@ -0,0 +1,289 @@
+#########################################################################################################
+# Module that compiles the trained NLTK Naive Bayes classifiers into NumPy arrays, so that a batch of  #
+# texts is classified with a few array operations instead of walking dictionaries for every word.      #
+# A compiled classifier has a vocabulary (word => row), a weights matrix (a row of log-probabilities   #
+# for every word, a column for every label) and a bias (the log-probability of every label). The       #
+# score of a text is the bias plus the rows of the distinct known words it contains.                   #
+# A compiled classifier is saved as a small JSON file (format, version, labels, vocabulary) next to    #
+# .npy files with its arrays, that numpy.load memory-maps, so all the processes share one copy.        #
+#########################################################################################################
+import json
+import os
+import pickle
+import sys
+import time
+import uuid
+try:
+    import numpy
+    from nltk.classify import NaiveBayesClassifier
+    from nltk.probability import FreqDist, ELEProbDist
+    from nltk.sentiment import SentimentAnalyzer
+    from nltk.sentiment.util import extract_unigram_feats
+except ImportError as e:
+    sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
+
+NEGATIVE_INFINITY = float("-inf")
+
+MODEL_FORMAT = "sa-naive-bayes"
+MODEL_VERSION = 1
+MODEL_EXTENSION = ".model.json"
+
+
+class CompiledNaiveBayes(object):
+    def __init__(self, labels, vocabulary, weights, bias):
+        # NLTK breaks a tie in favour of the greatest label and argmax picks the first column,
+        # so the labels are kept in descending order
+        order = sorted(range(len(labels)), key=lambda column: labels[column], reverse=True)
+        self.labels = [labels[column] for column in order]
+        self.vocabulary = vocabulary
+        self.weights = numpy.asarray(weights)
+        self.bias = numpy.asarray(bias, dtype=numpy.float64)
+        if order != list(range(len(labels))):  # a saved model is already in order, so its mapped weights stay so
+            self.weights = self.weights[:, order]
+            self.bias = self.bias[order]
+
+    # returns a matrix with the score of every label (columns) for every list of tokens (rows)
+    def scores(self, token_lists):
+        rows = []
+        documents = []
+        for number, tokens in enumerate(token_lists):
+            # a featureset has every word once, so a word found twice counts once
+            found = {self.vocabulary[token] for token in tokens if token in self.vocabulary}
+            rows.extend(found)
+            documents.extend([number] * len(found))
+
+        result = numpy.tile(self.bias, (len(token_lists), 1))
+        if len(rows) > 0:
+            # the product of the sparse (documents x vocabulary) matrix of the found words with the weights:
+            # we gather the rows of the found words and add them up per document
+            rows = numpy.array(rows, dtype=numpy.intp)
+            documents = numpy.array(documents, dtype=numpy.intp)
+            for column in range(len(self.labels)):
+                result[:, column] += numpy.bincount(documents, weights=self.weights[rows, column],
+                                                    minlength=len(token_lists))
+        return result
+
+    # returns the label of every list of tokens, in the same order
+    def classify_batch(self, token_lists):
+        if len(token_lists) == 0:
+            return []
+        return [self.labels[column] for column in numpy.argmax(self.scores(token_lists), axis=1)]
+
+    def classify(self, tokens):
+        return self.classify_batch([tokens])[0]
+
+
+# returns the log-probability (base 2, like NLTK) of the value of a feature given a label,
+# or -infinity if the classifier never saw the feature with this label
+def feature_logprob(classifier, label, feature, value):
+    probdist = classifier._feature_probdist.get((label, feature))  # NLTK has no public getter for these
+    if probdist is None:
+        return NEGATIVE_INFINITY
+    return probdist.logprob(value)
+
+
+# compiles a NaiveBayesClassifier trained on featuresets like training.bag_of_words makes: {word: True} for the
+# words of the text. A word the text doesn't have, isn't in its featureset, so it adds nothing to the score
+def compile_bag_of_words(classifier):
+    labels = list(classifier.labels())
+    words = sorted({feature for _, feature in classifier._feature_probdist})
+    vocabulary = {word: row for row, word in enumerate(words)}
+    weights = numpy.empty((len(words), len(labels)))
+    for row, word in enumerate(words):
+        for column, label in enumerate(labels):
+            weights[row, column] = feature_logprob(classifier, label, word, True)
+    bias = [classifier._label_probdist.logprob(label) for label in labels]
+    return CompiledNaiveBayes(labels, vocabulary, weights, bias)
+
+
+# compiles a SentimentAnalyzer whose only feature extractor is extract_unigram_feats. Its featureset has every
+# unigram, with True if the text has it and False if it doesn't. So the bias has the False log-probabilities
+# of all the unigrams and a word of the text adds the difference between its True and False log-probability
+def compile_unigram_analyzer(sentim_analyzer):
+    extractors = sentim_analyzer.feat_extractors
+    if list(extractors.keys()) != [extract_unigram_feats] or len(extractors[extract_unigram_feats]) != 1:
+        raise ValueError("Only a SentimentAnalyzer with one extract_unigram_feats extractor can be compiled")
+    parameters = extractors[extract_unigram_feats][0]
+    if parameters.get("handle_negation"):
+        raise ValueError("A SentimentAnalyzer that marks the negations can't be compiled")
+
+    classifier = sentim_analyzer.classifier
+    labels = list(classifier.labels())
+    known = {feature for _, feature in classifier._feature_probdist}
+    # the features that NLTK would discard as never seen, add nothing
+    words = sorted(word for word in set(parameters["unigrams"]) if "contains(" + word + ")" in known)
+    vocabulary = {word: row for row, word in enumerate(words)}
+    weights = numpy.empty((len(words), len(labels)))
+    bias = numpy.array([classifier._label_probdist.logprob(label) for label in labels])
+    for row, word in enumerate(words):
+        feature = "contains(" + word + ")"
+        for column, label in enumerate(labels):
+            absent = feature_logprob(classifier, label, feature, False)
+            bias[column] += absent
+            weights[row, column] = feature_logprob(classifier, label, feature, True) - absent
+    if not numpy.all(numpy.isfinite(weights)):
+        raise ValueError("The classifier has a feature value with zero probability, it can't be compiled")
+    return CompiledNaiveBayes(labels, vocabulary, weights, bias)
+
+
+# function that compiles the models of training: the polarity classifier or the subjectivity analyzer.
+# Raises ValueError for any other kind of model
+def compile_model(model):
+    if isinstance(model, SentimentAnalyzer):
+        return compile_unigram_analyzer(model)
+    if isinstance(model, NaiveBayesClassifier):
+        return compile_bag_of_words(model)
+    raise ValueError("Can't compile a " + type(model).__name__)
+
+
+# function that builds the NaiveBayesClassifier that NaiveBayesClassifier.train would train on featuresets like
+# training.bag_of_words makes ({word: True}), but from counts instead of one featureset at a time.
+# label_counts has the number of documents of every label and word_counts, for every word, the number of
+# documents of every label that have it: {word: {label: count}}
+def bag_of_words_classifier(label_counts, word_counts):
+    label_freqdist = FreqDist(label_counts)
+    feature_probdist = {}
+    for word, counts in word_counts.items():
+        # a document without the word doesn't have its feature, so NLTK counts it as the value None
+        missing = {label: label_freqdist[label] - counts.get(label, 0) for label in label_freqdist}
+        bins = 1 + (1 if any(value > 0 for value in missing.values()) else 0)
+        for label in label_freqdist:
+            freqdist = FreqDist()
+            if counts.get(label, 0) > 0:
+                freqdist[True] = counts[label]
+            if missing[label] > 0:
+                freqdist[None] = missing[label]
+            feature_probdist[label, word] = ELEProbDist(freqdist, bins=bins)
+    return NaiveBayesClassifier(ELEProbDist(label_freqdist), feature_probdist)
+
+
+# same as bag_of_words_classifier, but for the featuresets of extract_unigram_feats: every unigram is a feature
+# of every document, True if the document has it and False if it doesn't. word_counts must have every unigram
+def unigram_classifier(label_counts, word_counts):
+    label_freqdist = FreqDist(label_counts)
+    feature_probdist = {}
+    for word, counts in word_counts.items():
+        present = {label: counts.get(label, 0) for label in label_freqdist}
+        absent = {label: label_freqdist[label] - present[label] for label in label_freqdist}
+        bins = (1 if any(value > 0 for value in present.values()) else 0) + \
+               (1 if any(value > 0 for value in absent.values()) else 0)
+        for label in label_freqdist:
+            freqdist = FreqDist()
+            if present[label] > 0:
+                freqdist[True] = present[label]
+            if absent[label] > 0:
+                freqdist[False] = absent[label]
+            feature_probdist[label, "contains(" + word + ")"] = ELEProbDist(freqdist, bins=bins)
+    return NaiveBayesClassifier(ELEProbDist(label_freqdist), feature_probdist)
+
+
+# returns the counts of bag_of_words_classifier and unigram_classifier for the given documents of a
+# features.FeatureMatrix. With only_seen, the words that none of the documents has are left out
+def matrix_counts(matrix, documents, only_seen=False):
+    label_counts = {}
+    for document in documents:
+        label_counts[matrix.labels[document]] = label_counts.get(matrix.labels[document], 0) + 1
+    columns = {label: matrix.document_counts([document for document in documents
+                                              if matrix.labels[document] == label])
+               for label in label_counts}
+    word_counts = {}
+    for number, word in enumerate(matrix.words):
+        counts = {label: int(columns[label][number]) for label in label_counts if columns[label][number] > 0}
+        if len(counts) > 0 or not only_seen:
+            word_counts[word] = counts
+    return label_counts, word_counts
+
+
+# trains the polarity classifier on the documents of a features.FeatureMatrix. Like NaiveBayesClassifier.train,
+# only the words of the training documents are features
+def train_bag_of_words(matrix, documents):
+    return bag_of_words_classifier(*matrix_counts(matrix, documents, only_seen=True))
+
+
+# trains the subjectivity classifier on the documents of a features.FeatureMatrix, whose words are the unigrams
+def train_unigrams(matrix, documents):
+    return unigram_classifier(*matrix_counts(matrix, documents))
+
+
+# returns the path of the compact model file of a pickle file, e.g. files/sa_polarity.model.json
+def model_path_of(pickle_path):
+    return os.path.splitext(pickle_path)[0] + MODEL_EXTENSION
+
+
+# function that saves a compiled classifier in the compact format. The arrays get new file names every time and
+# the JSON file that names them is replaced at once, so a process that reads the model while we write it, gets
+# either the old or the new one. The weights are float32, the bias float64 because it sums thousands of terms
+def save_compiled(compiled, path):
+    base = path[:-len(MODEL_EXTENSION)] if path.endswith(MODEL_EXTENSION) else path
+    # the time sorts the files by age, the random part keeps two saves of the same millisecond apart
+    stamp = str(int(time.time() * 1000)) + "-" + uuid.uuid4().hex
+    weights_path = base + "." + stamp + ".weights.npy"
+    bias_path = base + "." + stamp + ".bias.npy"
+    numpy.save(weights_path, compiled.weights.astype(numpy.float32))
+    numpy.save(bias_path, compiled.bias.astype(numpy.float64))
+
+    words = [None] * len(compiled.vocabulary)
+    for word, row in compiled.vocabulary.items():
+        words[row] = word
+    model = {"format": MODEL_FORMAT,
+             "version": MODEL_VERSION,
+             "labels": compiled.labels,
+             "vocabulary": words,
+             "weights": os.path.basename(weights_path),
+             "bias": os.path.basename(bias_path)}
+
+    previous = read_model_file(path) if os.path.exists(path) else None
+    temporary_path = path + "." + stamp + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as outfile:
+        json.dump(model, outfile)
+    os.replace(temporary_path, path)
+
+    # the arrays of the previous model aren't used anymore. A process that has them mapped keeps its copy
+    if previous is not None:
+        for name in (previous.get("weights"), previous.get("bias")):
+            if name is not None and name not in (model["weights"], model["bias"]):
+                try:
+                    os.remove(os.path.join(os.path.dirname(path), name))
+                except OSError:
+                    pass
+
+
+# returns the content of a compact model file. Raises ValueError if it is not a model or its version is unknown
+def read_model_file(path):
+    with open(path, encoding="utf-8") as datafile:
+        model = json.load(datafile)
+    if not isinstance(model, dict) or model.get("format") != MODEL_FORMAT:
+        raise ValueError(path + " is not a " + MODEL_FORMAT + " model")
+    if model.get("version") != MODEL_VERSION:
+        raise ValueError(path + " has version " + str(model.get("version")) + ", but we can read only version " +
+                         str(MODEL_VERSION))
+    return model
+
+
+# function that loads a compiled classifier from its compact model file. The weights are memory-mapped
+def load_compiled(path):
+    model = read_model_file(path)
+    folder = os.path.dirname(path)
+    weights = numpy.load(os.path.join(folder, model["weights"]), mmap_mode="r")
+    bias = numpy.load(os.path.join(folder, model["bias"]))
+    vocabulary = {word: row for row, word in enumerate(model["vocabulary"])}
+    if weights.shape != (len(vocabulary), len(model["labels"])):
+        raise ValueError(path + " has weights of shape " + str(weights.shape) + " for " + str(len(vocabulary)) +
+                         " words and " + str(len(model["labels"])) + " labels")
+    return CompiledNaiveBayes(model["labels"], vocabulary, weights, bias)
+
+
+# function that writes the compact model file of a pickled classifier of training, e.g. one trained before
+# the compact format existed
+def export_pickle(pickle_path):
+    with open(pickle_path, "rb") as datafile:
+        model = pickle.load(datafile)
+    path = model_path_of(pickle_path)
+    save_compiled(compile_model(model), path)
+    return path
+
+
+if __name__ == '__main__':
+    # python -m utils.naive_bayes files/sa_polarity.pickle files/sa_subjectivity.pickle
+    for argument in sys.argv[1:]:
+        print("Saved " + export_pickle(argument))
@@ -1,49 +1,35 @@
 #######################################################################################################
 # Module that is responsible to functionalities like tweet formatting etc.                            #
 #######################################################################################################
-from utils import sentiment_utils, read_write
+from utils import sentiment_utils, read_write, vocabulary, metrics
 import sys
-import string
 import re
 import os
+from datetime import datetime
 
 try:
     from nltk.tokenize import word_tokenize
-    from nltk.corpus import stopwords
 except ImportError as e:
     read_write.log_message("[FATAL] (other_utils) : ImportError: " + str(e))
     sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
 
 LOG_NAME = " (other_utils) : "
+TWITTER_TIME_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"  # how the Twitter API writes the created_at of a tweet
 
-try:
-    stops = stopwords.words('english')
-except LookupError as e:
-    read_write.log_message("[FATAL] (other_utils) : LookupError: " + str(e))
-    instructions = " ****   INSTALLATION INSTRUCTIONS   ****\n\n"
-    instructions += "    1) Open a new terminal and type python. This will open a python terminal\n"
-    instructions += "    2) Type import ntlk\n    3) Type nltk.download()\n"
-    instructions += "    4) This will open a new window. Search in CORPORA for the package named 'Stopwords'\n"
-    instructions += "    5) Double click OR click download to install it"
-    read_write.log_message(instructions)
-    sys.exit(str(e) + "\n" + instructions)
-
-punctuation = list(string.punctuation)
-punctuation.append("''")
-punctuation.append("``")
-punctuation.append("—")
-punctuation.append("…")
-punctuation.append("...")
-punctuation.append("--")
-punctuation.append("..")
-stops.extend(punctuation)
-stops.append("rt")
-
-regexes = [
-    re.compile('#.*'),  # finding hashtags
-    re.compile('.*http[s]?://.*'),  # finding urls
-    re.compile('@.*'),  # finding mentions
-]
+stops = vocabulary.tweet_stops
+punctuation = vocabulary.punctuation
+
+# one pattern for all the entities of a tweet. Hashtags and mentions are anchored at the start of the token,
+# urls can start anywhere inside it. The name of the group that matched, tells us what kind of entity we found
+entity_regex = re.compile(r'(?P<hashtags>^#)|(?P<mentions>^@)|(?P<urls>https?://)')
+
+
+# function that returns the kind of entity of a word ("hashtags", "mentions" or "urls"), or None if it's not one
+def entity_kind(word):
+    match = entity_regex.search(word)
+    if match is None:
+        return None
+    return match.lastgroup
 
 
 # function to clear the text of a tweet into two lists, one for text and one for stop_words
@@ -54,6 +40,7 @@ def clear_text(text):
     stop_words = []  # this list holds all the stop words
     punctuations = []  # this list holds all the punctuation marks
     entities = []  # this list holds all mentions, hastags and urls
+    entities_by_kind = {"hashtags": [], "mentions": [], "urls": []}  # and this the same entities, by their kind
 
     try:
         # tokenize the text into a list
@@ -67,6 +54,7 @@ def clear_text(text):
         instructions += "    5) Double click OR click download to install it"
         read_write.log_message(instructions)
         print(str(e) + "\n" + instructions)
+        read_write.flush_log()  # os._exit doesn't wait for the log's thread
         os._exit(1)
 
     # re-build the string because NLTK does not understand mentions or hashtags etc
@@ -86,8 +74,10 @@ def clear_text(text):
             continue
 
         # and distribute the word into the matching list
-        if any(regex.match(word) for regex in regexes):
+        kind = entity_kind(word)
+        if kind is not None:
             entities.append(word)
+            entities_by_kind[kind].append(word)
         else:
             if word not in stops:
                 # entry = {"value": word} # this is not needed anymore
@@ -99,6 +89,9 @@ def clear_text(text):
                     stop_words.append(word)
 
     response["entities"] = entities
+    response["hashtags"] = entities_by_kind["hashtags"]
+    response["mentions"] = entities_by_kind["mentions"]
+    response["urls"] = entities_by_kind["urls"]
     response["punctuation"] = punctuations
     response["words"] = words
     response["stop_words"] = stop_words
@@ -109,78 +102,127 @@ def clear_text(text):
 # function that re-builds the tokens list, because some words are not acceptable by word_tokenizer of NLTK
 # such as @mentions or #hashtags or https://urls
 def re_build_text(text):
+    # we build a new list in one pass, instead of removing the merged tokens from the given one.
+    # Removing from a list costs O(n) for every merged token and remove() deletes the first equal token,
+    # which is not always the one right after the current token
     escape_symbols = ["@", "#"]
-    counter = 0
-    for index in text:
+    vowels = ["a", "e", "i", "o", "u"]
+    rebuilt_text = []
+    length = len(text)
+    counter = 0  # position of the next token to read
+    while counter < length:
+        index = text[counter]
+        counter += 1
         # building hashtags and mentions into one item
         if index in escape_symbols:
-            try:
-                index = index + text[counter + 1]
-                text.remove(text[counter + 1])
-
-                # if there is a : symbol, it connects with the previous word, that now is -1 indexes behind
-                # because we removed the previous one
-                if text[counter + 1] is ":":
+            if counter < length:
+                index = index + text[counter]
+                counter += 1
+                # if there is a : symbol, it connects with the mention or hashtag
+                if counter < length and text[counter] == ":":
                     index = index + ":"
-                    text.remove(text[counter + 1])
-            except IndexError:
-                pass
-            text[counter] = index  # save the index into the current item, but have the others removed
-        # building the urls into one item
+                    counter += 1
+        # building the urls into one item, urls are tokenized as "http(s)", ":" and "//the/rest"
         elif index == "http" or index == "https":
-            try:
-                index += text[counter + 1]
-                text.remove(text[counter + 1])
-            except IndexError:
-                pass
-            try:
-                index += text[counter + 1]
-                text.remove(text[counter + 1])
-            except IndexError:
-                pass
-            text[counter] = index
+            for _ in range(2):
+                if counter < length:
+                    index += text[counter]
+                    counter += 1
         # building n't endings, into one item with previous one
         elif index == "n't":
             # if previous word ends with vowel, add the "n" at the end of the word
-            if text[counter - 1][-1:] in ["a", "e", "i", "o", "u"]:
-                text[counter - 1] = text[counter - 1] + "n"
-            text[counter] = "not"
+            if rebuilt_text and rebuilt_text[-1][-1:] in vowels:
+                rebuilt_text[-1] = rebuilt_text[-1] + "n"
+            index = "not"
         elif index == "'re":
-            text[counter] = "are"
+            index = "are"
 
-        counter += 1
+        rebuilt_text.append(index)
 
-    return text
+    return rebuilt_text
 
 
 def only_useful_words(text):
     response = clear_text(text)
-    return " ".join(str(x) for x in response["words"])
+    return useful_words_of(response)
+
+
+# function that joins the meaningful words of an already cleared text (the response of clear_text)
+def useful_words_of(cleared_text):
+    return " ".join(str(x) for x in cleared_text["words"])
+
+
+# clear_text of the stream, that is timed as the "clean" stage of the metrics
+def timed_clear_text(text):
+    with metrics.timed("clean"):
+        return clear_text(text)
 
 
 def format_tweet(tweet, **kwargs):
     formatted_tweet = {}
-    cleared_text = clear_text(tweet["text"])
-    useful_words = only_useful_words(tweet["text"])
+    cleared_text = timed_clear_text(tweet["text"])
+    useful_words = useful_words_of(cleared_text)  # we don't clear the text again, we use the words we already have
     if kwargs["method"] is "stream":
-        # see "anatomy of a tweet" for more details
-        # IMPORTANT: tweepy.api.stream method, returns StreamResult Object
-        # we can't parse it like json, but it does the parsing itself for us
-        # only thing remaining is to call it's values like that.
-        # we again create the dictionary to store the document to MongoDB
-        formatted_tweet = {"_id": tweet["id"],  # this will make the tweet's id, ObjectID
-                           "whole_text": tweet["text"],
-                           "text": cleared_text,
-                           "textblob": {
-                               "polarity": sentiment_utils.textblob_polarity(useful_words),
-                               "subjectivity": sentiment_utils.textblob_subjectivity(useful_words)
-                           },
-                           "vader": {
-                               "polarity": sentiment_utils.vader_polarity(useful_words)
-                           },
-                           "training": {
-                               "polarity": sentiment_utils.sent_result_polarity(useful_words),
-                               "subjectivity": sentiment_utils.sent_result_subjectivity(useful_words)
-                           }}
+        formatted_tweet = build_document(tweet, cleared_text, sentiment_utils.score(useful_words),
+                                         kwargs.get("keywords", []))
     # and we return the results
     return formatted_tweet
+
+
+# same as format_tweet, but for a list of tweets. The sentiment analysis of all of them happens at once, in the
+# scoring processes of sentiment_utils. Returns the list of the formatted tweets in the same order
+def format_tweets(tweets, **kwargs):
+    if kwargs["method"] != "stream":
+        return [{} for _ in tweets]
+    cleared_texts = [timed_clear_text(tweet["text"]) for tweet in tweets]
+    scores = sentiment_utils.score_batch([useful_words_of(cleared_text) for cleared_text in cleared_texts])
+    return [build_document(tweet, cleared_text, tweet_scores, kwargs.get("keywords", []))
+            for tweet, cleared_text, tweet_scores in zip(tweets, cleared_texts, scores)]
+
+
+# function that returns which of the keywords we track, a tweet contains. Like the Streaming API does, we match
+# whole words and not parts of them ("art" doesn't match "start"), a hashtag or a mention matches with or without
+# its # or @, and a keyword with many words matches if the tweet contains all of them, in any order.
+# cleared_text is what clear_text returned for the text of the tweet, so we use the tokens we already have
+def matched_keywords(cleared_text, keywords):
+    tokens = set(cleared_text["words"]) | set(cleared_text["stop_words"])
+    for entity in cleared_text["hashtags"] + cleared_text["mentions"]:
+        entity = entity.rstrip(":")  # the mention of a retweet keeps the : that follows it
+        tokens.add(entity)
+        tokens.add(entity[1:])
+    return [keyword for keyword in keywords if all(word in tokens for word in keyword.lower().split())]
+
+
+# function that returns when a tweet was created, in UTC, like the datetimes that MongoDB gives back.
+# The Streaming API sends it twice, as timestamp_ms and as created_at. If a tweet has neither of them, or we
+# can't read them, we use the time that we store it
+def tweet_time(tweet):
+    try:
+        if tweet.get("timestamp_ms") is not None:
+            return datetime.utcfromtimestamp(int(tweet["timestamp_ms"]) / 1000)
+        created_at = tweet.get("created_at")
+        if isinstance(created_at, datetime):
+            return created_at
+        if created_at is not None:
+            return datetime.strptime(created_at, TWITTER_TIME_FORMAT)
+    except (TypeError, ValueError, OverflowError, OSError) as e:
+        read_write.log_message("[WARN]" + LOG_NAME + "Can't read the time of tweet " + str(tweet.get("id")) + ", " +
+                               type(e).__name__ + ": " + str(e) + ". Using the current time")
+    return datetime.utcnow()
+
+
+def build_document(tweet, cleared_text, scores, keywords):
+    # see "anatomy of a tweet" for more details
+    # IMPORTANT: tweepy.api.stream method, returns StreamResult Object
+    # we can't parse it like json, but it does the parsing itself for us
+    # only thing remaining is to call it's values like that.
+    # we again create the dictionary to store the document to MongoDB
+    formatted_tweet = {"_id": tweet["id"],  # this will make the tweet's id, ObjectID
+                       "whole_text": tweet["text"],
+                       "text": cleared_text,
+                       "textblob": scores["textblob"],
+                       "vader": scores["vader"],
+                       "training": scores["training"],
+                       "keywords": matched_keywords(cleared_text, keywords),
+                       "created_at": tweet_time(tweet)}  # when it was tweeted, the rollups use this
+    return formatted_tweet
@@ -0,0 +1,17 @@
+###############################################################################################
+# Module that creates the pools of processes of the program: the scoring pool of            #
+# sentiment_utils and the pool of features that extracts the features of the training       #
+###############################################################################################
+import multiprocessing
+
+
+# function that returns a new pool of the given number of processes. The GUI runs the Tk loop, the stream's
+# workers, the training, the log and the metrics in threads of one process, and a fork copies only the thread
+# that forks, with the locks that the others held at that moment. So we never fork the program: the processes
+# start from a clean process, with forkserver where it exists, or else with spawn (e.g. on Windows)
+def create_pool(processes, initializer=None, initargs=()):
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+    return context.Pool(processes=processes, initializer=initializer, initargs=initargs)
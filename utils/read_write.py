@@ -1,6 +1,7 @@
 ###############################################################
 # Module that is responsible to write or read data from files #
 ###############################################################
+from utils import log_writer
 import json
 import os
 from datetime import datetime
@@ -18,9 +19,11 @@ def get_timestamp():
 
 
 # we initialize a log_file, every time the program starts
-log_file = str(get_timestamp()).replace(' ', '_').replace(':', '-') + ".log"
+log_file = log_writer.file_name_of(get_timestamp())
 log_path = os.path.abspath("logs/" + log_file)
 print("[INFO] Log file path set: " + str(log_path))
+# it writes the log in a background thread and starts a new file when this one grows too large or too old
+log = log_writer.LogWriter(os.path.abspath("logs"), log_file)
 
 
 # function that returns the data in json format from mongo.json file
@@ -102,14 +105,25 @@ def write_keywords(data):
         json.dump(keywords, outfile, sort_keys=False, indent=2)
 
 
-# function that opens the log file and appends the new message
+# function that appends the new message to the log file. The message is written by the log's thread a moment
+# later, and only if its level (the tag it starts with, e.g. [INFO]) is enabled
 def log_message(message):
-    with open(log_path, "a") as logging:
-        try:
-            logging.write(str(get_timestamp()) + " >> " + message + "\n")
-        except UnicodeEncodeError as e:
-            message = str(get_timestamp()) + "[WARN]" + LOG_NAME + "UnicodeEncodeError: " + str(e) + "\n"
-            logging.write(message)
+    log.write(message)
+
+
+# a process of a pool calls this, so that it writes in the log file of the program instead of a new one
+def use_log_file(path):
+    log.path = path
+
+
+# function that sets the lowest level of the messages we write, e.g. "WARN" to suppress [INFO] messages
+def set_log_level(level):
+    log.set_level(level)
+
+
+# function that writes the buffered messages now, e.g. before the program exits without running atexit
+def flush_log():
+    log.flush()
 
 
 # function that gets as argument a window and sets a favicon to it
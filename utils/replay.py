@@ -0,0 +1,96 @@
+##############################################################################################################
+# Module that replays recorded tweets (one raw tweet JSON per line, plain or gzip) through the same pipeline #
+# as the Streaming API: StdOutListener.on_data => workers => format_tweets => MongoDB.                       #
+# Example: python -m utils.replay tweets.jsonl.gz --db twitter --collection replayed --rate 200              #
+##############################################################################################################
+from utils import read_write, stream_util, ingest, dialogs, metrics, sentiment_utils
+import argparse
+import gzip
+import time
+
+LOG_NAME = " (replay) : "
+
+
+# opens a recorded file as text. Gzip files are recognized by their first two bytes, not by their name
+def open_recording(path):
+    with open(path, "rb") as recording:
+        magic = recording.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+# function that feeds every line of the recorded files to the listener's on_data, like the Streaming API does.
+# rate is the number of tweets per second, or None to replay them as fast as the listener accepts them.
+# Returns a dictionary with the number of lines sent, the elapsed seconds and the counters of the listener
+def replay(paths, listener, rate=None, search_keyword=None):
+    listener.set_flag(False)
+    listener.set_pause(False)
+    listener.start(search_keyword)
+
+    sent = 0
+    stopped = False
+    start_time = time.perf_counter()
+    for path in paths:
+        if stopped:
+            break
+        read_write.log_message("[INFO]" + LOG_NAME + "Replaying " + path)
+        with open_recording(path) as recording:
+            for line in recording:
+                line = line.strip()
+                if line == "":
+                    continue
+                if rate is not None:  # wait until it's time for this tweet
+                    delay = start_time + sent / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                if listener.on_data(line) is False:  # the listener wants to stop, e.g. it lost the DB
+                    stopped = True
+                    break
+                sent += 1
+
+    # like when the stream stops, the workers finish what is left in the queue
+    listener.set_flag(True)
+    for worker in listener.workers:
+        worker.join()
+    elapsed = time.perf_counter() - start_time
+
+    result = {"sent": sent, "elapsed": elapsed, "stored": listener.store_counter,
+              "ignored": listener.ignore_counter, "dropped": listener.work_queue.dropped}
+    message = "[INFO]" + LOG_NAME + "Replayed " + str(sent) + " tweets in " + str(round(elapsed, 2)) + \
+              " seconds (" + str(round(sent / elapsed, 1) if elapsed > 0 else 0) + " tweets/sec) - Stored " + \
+              str(result["stored"]) + " - Ignored " + str(result["ignored"]) + " - Dropped " + str(result["dropped"])
+    print(message)
+    read_write.log_message(message)
+    return result
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.replay",
+                                     description="Replay recorded raw tweets (JSON lines, plain or gzip) "
+                                                 "through the stream pipeline into MongoDB.")
+    parser.add_argument("files", nargs="+", help="recorded files, one raw tweet JSON per line")
+    ingest.add_pipeline_arguments(parser)
+    parser.add_argument("--rate", type=float, default=None,
+                        help="tweets per second (default: as fast as possible)")
+    parser.add_argument("--track", default=None,
+                        help="comma separated keywords to mark the tweets with, like the stream does")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    dialogs.set_headless()
+    if options.log_level is not None:
+        read_write.set_log_level(options.log_level)
+    ingest.select_collection(options)
+    ingest.serve_metrics(options)
+    listener = stream_util.StdOutListener(workers=options.workers, queue_size=options.queue_size,
+                                          queue_policy=options.queue_policy, spill_path=options.spill_path)
+    replay(options.files, listener, rate=options.rate, search_keyword=options.track)
+    sentiment_utils.close_scoring_pool()
+    metrics.stop_serving()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
 #####################################################################################################
 # Module that is responsible for the sentiment analysis of the tweets                               #
 #####################################################################################################
-from utils import read_write, training
+from utils import read_write, training, metrics, naive_bayes, processes
 import sys
+import os
+import math
+import time
+import threading
 try:
     from textblob import TextBlob
     from nltk.sentiment.util import *
@@ -25,12 +29,55 @@ except LookupError as e:
 
 LOG_NAME = " (sentiment_utils) : "
 
+POLARITY_MODEL = 'files/sa_polarity.pickle'
+SUBJECTIVITY_MODEL = 'files/sa_subjectivity.pickle'
+
+# registry of the custom classifiers, keyed by the path of their file. Every entry holds the loaded object
+# (None for a compact model file), its compiled form (see naive_bayes) and the modification time of the file at
+# the moment we loaded it, so a classifier is loaded once and shared by every thread, until a new training
+# overwrites the file
+models = {}
+models_lock = threading.Lock()
+
+# VADER parses its whole lexicon file when constructed, so we build one analyzer the first time it's needed and
+# share it. polarity_scores() only reads the lexicon, so the same instance can be used from many threads
+vader_analyzer = None
+vader_lock = threading.Lock()
+
+# all the analyzers are pure Python, so in one process they can't use more than one core. score_batch sends
+# the texts to a pool of processes, where every process loads the analyzers once, when it starts
+SCORING_PROCESSES = os.cpu_count() or 1
+SCORING_CHUNK_SIZE = 20  # the most texts a process gets at once
+SCORING_POOL_RETRY = 60  # seconds after the analyzers failed to load, before we try to start the pool again
+scoring_pool = None
+scoring_pool_failed = None  # when the analyzers couldn't load, until we try again we score in this process
+scoring_pool_lock = threading.Lock()
+
 
 def textblob_polarity(text):
+    testimonial = TextBlob(text)
+    return textblob_polarity_label(testimonial.sentiment.polarity)
+
+
+def textblob_subjectivity(text):
+    testimonial = TextBlob(text)
+    return textblob_subjectivity_label(testimonial.sentiment.subjectivity)
+
+
+# function that analyzes the text once and returns both Textblob labels, together with the raw scores,
+# so that we can re-threshold the stored tweets later without running the analyzer again
+def textblob_scores(text):
+    sentiment = TextBlob(text).sentiment
+    response = {"polarity": textblob_polarity_label(sentiment.polarity),
+                "subjectivity": textblob_subjectivity_label(sentiment.subjectivity),
+                "polarity_score": sentiment.polarity,
+                "subjectivity_score": sentiment.subjectivity}
+    return response
+
+
+def textblob_polarity_label(polarity_value):
     # Textblob polarity values: negative vs. positive   (-1.0 => +1.0)
     #                                                   Zero value is neutral
-    testimonial = TextBlob(text)
-    polarity_value = testimonial.sentiment.polarity
     if polarity_value > 0:
         label = "pos"
     elif polarity_value == 0:
@@ -41,10 +88,8 @@ def textblob_polarity(text):
     return label
 
 
-def textblob_subjectivity(text):
+def textblob_subjectivity_label(subjectivity_value):
     # Textblob  subjectivity values: objective vs. subjective (+0.0 => +1.0)
-    testimonial = TextBlob(text)
-    subjectivity_value = testimonial.sentiment.subjectivity
     if subjectivity_value >= 0.5:
         label = "subj"
     else:
@@ -53,12 +98,32 @@ def textblob_subjectivity(text):
     return label
 
 
+# function that returns the shared VADER analyzer, creating it on the first call
+def get_vader_analyzer():
+    global vader_analyzer
+    if vader_analyzer is None:
+        with vader_lock:
+            if vader_analyzer is None:  # another thread may have built it while we were waiting
+                vader_analyzer = SentimentIntensityAnalyzer()
+    return vader_analyzer
+
+
 def vader_polarity(text):
     # VADER polarity values: negative vs. positive   (-1.0 => 1.0)
     #                                                (-0.2,0.2) values are neutral
-    analyzer = SentimentIntensityAnalyzer()
+    analyzer = get_vader_analyzer()
     scores = analyzer.polarity_scores(text)
 
+    return vader_label(scores)
+
+
+# same as vader_polarity, but for a list of texts. Returns the list of labels in the same order
+def vader_polarity_batch(texts):
+    analyzer = get_vader_analyzer()
+    return [vader_label(analyzer.polarity_scores(text)) for text in texts]
+
+
+def vader_label(scores):
     # compound value is chosen because we want multidimensional measures of sentiment just like Textblob
     # We will consider posts with a compound value greater than 0.2 as positive and less than -0.2 as negative.
     # There's some testing and experimentation that goes with choosing these ranges,
@@ -76,24 +141,217 @@ def vader_polarity(text):
     return label
 
 
+# function that returns the classifier stored in the given pickle file. The file is read only the first time
+# or when its modification time changed since the last time we loaded it (e.g. after a training of
+# training.training_controller saved a new one)
+def get_model(path):
+    return get_model_entry(path)["model"]
+
+
+# function that returns the compiled form of the classifier of the given pickle file,
+# or None if it can't be compiled (then we classify with the NLTK object).
+# If training saved the compact model file too, we load that one and we don't un-pickle anything
+def get_compiled_model(path):
+    model_path = naive_bayes.model_path_of(path)
+    if os.path.exists(model_path) and not (os.path.exists(path) and
+                                           os.path.getmtime(path) > os.path.getmtime(model_path)):
+        try:
+            return get_model_entry(model_path)["compiled"]
+        except (ValueError, OSError) as e:  # e.g. a newer version of the format, so we use the pickle
+            read_write.log_message("[WARN]" + LOG_NAME + type(e).__name__ + ": " + str(e))
+    return get_model_entry(path)["compiled"]
+
+
+def get_model_entry(path):
+    mtime = os.path.getmtime(path)
+    with models_lock:
+        entry = models.get(path)
+        if entry is None or entry["mtime"] != mtime:
+            if path.endswith(naive_bayes.MODEL_EXTENSION):
+                entry = {"model": None, "compiled": naive_bayes.load_compiled(path), "mtime": mtime}
+            else:
+                entry = {"model": load_pickle(path), "mtime": mtime}
+                try:
+                    entry["compiled"] = naive_bayes.compile_model(entry["model"])
+                except ValueError as e:
+                    read_write.log_message("[WARN]" + LOG_NAME + "ValueError: " + str(e))
+                    entry["compiled"] = None
+            models[path] = entry
+            read_write.log_message("[INFO]" + LOG_NAME + "Classifier loaded from " + path)
+    return entry
+
+
+def load_pickle(path):
+    # cache=False, because NLTK keeps its own cache and would hand us back the old object
+    return load(path, cache=False)
+
+
+# the tokens that the polarity classifier sees: the words of training.bag_of_words
+def polarity_tokens(text):
+    return training.bag_of_words(word_tokenize(text)).keys()
+
+
+# the tokens that the subjectivity analyzer sees: the lower case words between the whitespace
+def subjectivity_tokens(text):
+    word_tokenizer = regexp.WhitespaceTokenizer()
+    return [word.lower() for word in word_tokenizer.tokenize(text)]
+
+
 def sent_result_polarity(text):
     # Classify a single sentence as positive/negative using a stored custom classifier.
-    tokens = word_tokenize(text)
-    custom_set = training.bag_of_words(tokens)
-    classifier = load('files/sa_polarity.pickle')
-    label = classifier.classify(custom_set)
-
-    return label
+    return sent_result_polarity_batch([text])[0]
 
 
 def sent_result_subjectivity(text):
     # Classify a single sentence as subjective/objective using a stored custom classifier.
-    word_tokenizer = regexp.WhitespaceTokenizer()
-    # Tokenize and convert to lower case
-    tokenized_text = [word.lower() for word in word_tokenizer.tokenize(text)]
-    sentim_analyzer = load('files/sa_subjectivity.pickle')
-    label = sentim_analyzer.classify(tokenized_text)
+    return sent_result_subjectivity_batch([text])[0]
 
-    return label
+
+# same as sent_result_polarity, but for a list of texts, that are classified all together by the compiled
+# classifier. Returns the list of labels in the same order
+def sent_result_polarity_batch(texts):
+    token_lists = [polarity_tokens(text) for text in texts]
+    compiled = get_compiled_model(POLARITY_MODEL)
+    if compiled is not None:
+        return compiled.classify_batch(token_lists)
+    classifier = get_model(POLARITY_MODEL)
+    return [classifier.classify(dict.fromkeys(tokens, True)) for tokens in token_lists]
+
+
+def sent_result_subjectivity_batch(texts):
+    token_lists = [subjectivity_tokens(text) for text in texts]
+    compiled = get_compiled_model(SUBJECTIVITY_MODEL)
+    if compiled is not None:
+        return compiled.classify_batch(token_lists)
+    sentim_analyzer = get_model(SUBJECTIVITY_MODEL)
+    return [sentim_analyzer.classify(tokens) for tokens in token_lists]
+
+
+# function that runs all the analyzers on a text and returns their labels, like they are stored in MongoDB
+def score(text):
+    return score_batch([text])[0]
+
+
+# function that runs all the analyzers on a list of texts and returns the list of their labels, together with
+# how many seconds every analyzer took for every text. The processes of the scoring pool run this, because they
+# can't update the metrics of the main process themselves. The custom classifiers score the whole list at once,
+# so their time is split evenly between the texts
+def timed_score(texts):
+    timings = [{} for _ in texts]
+    textblob = []
+    vader = []
+    for text, text_timings in zip(texts, timings):
+        start = time.perf_counter()
+        textblob.append(textblob_scores(text))
+        text_timings["textblob"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vader.append(vader_polarity(text))
+        text_timings["vader"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    training_polarity = sent_result_polarity_batch(texts)
+    polarity_seconds = (time.perf_counter() - start) / len(texts)
+
+    start = time.perf_counter()
+    training_subjectivity = sent_result_subjectivity_batch(texts)
+    subjectivity_seconds = (time.perf_counter() - start) / len(texts)
+
+    responses = []
+    for number, text_timings in enumerate(timings):
+        text_timings["training_polarity"] = polarity_seconds
+        text_timings["training_subjectivity"] = subjectivity_seconds
+        responses.append({"textblob": textblob[number],
+                          "vader": {
+                              "polarity": vader[number]
+                          },
+                          "training": {
+                              "polarity": training_polarity[number],
+                              "subjectivity": training_subjectivity[number]
+                          }})
+    return responses, timings
+
+
+# function that adds the timings of timed_score to the metrics, one stage per analyzer
+def record_timings(timings):
+    for text_timings in timings:
+        for analyzer, seconds in text_timings.items():
+            metrics.observe(analyzer, seconds)
+
+
+# same as score, but for a list of texts, that are scored in parallel by the processes of the scoring pool.
+# Returns the list of the results in the same order
+def score_batch(texts):
+    if len(texts) == 0:
+        return []
+    pool = None
+    if SCORING_PROCESSES > 1 and len(texts) > 1:  # there is no point to send one text to another process
+        pool = get_scoring_pool()
+    if pool is None:
+        responses, timings = timed_score(texts)
+        record_timings(timings)
+        return responses
+    # split the texts evenly between the processes, but not in chunks larger than SCORING_CHUNK_SIZE.
+    # Every process gets whole chunks, so the custom classifiers score a chunk at once
+    chunk_size = max(1, min(SCORING_CHUNK_SIZE, math.ceil(len(texts) / SCORING_PROCESSES)))
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    responses = []
+    for chunk_responses, timings in pool.map(timed_score, chunks, chunksize=1):
+        record_timings(timings)
+        responses.extend(chunk_responses)
+    return responses
+
+
+# function that returns the pool of the scoring processes, creating it on the first call, or None if the
+# analyzers can't be loaded. We load them here first: if a process of the pool failed to load them, the pool
+# would start a new process again and again and score_batch would never return. After a failure we try again
+# every SCORING_POOL_RETRY seconds, e.g. the stream started before the first training saved the classifiers
+def get_scoring_pool():
+    global scoring_pool, scoring_pool_failed
+    with scoring_pool_lock:
+        if scoring_pool is None and (scoring_pool_failed is None or
+                                     time.time() - scoring_pool_failed >= SCORING_POOL_RETRY):
+            try:
+                load_analyzers()
+            except Exception as e:  # e.g. a missing pickle or VADER lexicon
+                read_write.log_message("[ERROR]" + LOG_NAME + "The analyzers can't be loaded, the tweets are scored "
+                                       "without the scoring pool for " + str(SCORING_POOL_RETRY) + " seconds. " +
+                                       type(e).__name__ + ": " + str(e))
+                scoring_pool_failed = time.time()
+                return None
+            scoring_pool_failed = None
+            scoring_pool = processes.create_pool(SCORING_PROCESSES, initializer=start_scoring_process,
+                                                 initargs=(read_write.log.path,))
+            read_write.log_message("[INFO]" + LOG_NAME + "Scoring pool started with " + str(SCORING_PROCESSES) +
+                                   " processes")
+    return scoring_pool
+
+
+# function that stops the processes of the scoring pool, after they finish the texts they have. The next
+# score_batch starts a new pool
+def close_scoring_pool():
+    global scoring_pool, scoring_pool_failed
+    with scoring_pool_lock:
+        if scoring_pool is not None:
+            scoring_pool.close()
+            scoring_pool.join()
+            scoring_pool = None
+        scoring_pool_failed = None
+
+
+# every process of the scoring pool runs this once it starts, so it doesn't load the analyzers with the first text.
+# It must not raise, or the pool replaces the process with a new one that fails the same way. If the analyzers
+# can't load, the first text that the process gets raises the error, back in score_batch
+def start_scoring_process(log_path):
+    read_write.use_log_file(log_path)  # the processes log in the file of the program, not in one of their own
+    try:
+        load_analyzers()
+    except Exception as e:
+        read_write.log_message("[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e))
+    read_write.flush_log()  # the processes of a pool end with os._exit, that doesn't wait for the log's thread
 
 
+def load_analyzers():
+    get_vader_analyzer()
+    get_compiled_model(POLARITY_MODEL)
+    get_compiled_model(SUBJECTIVITY_MODEL)
@@ -1,22 +1,41 @@
 #######################################################################################
 # Module that is responsible to connect to the Streaming Server and gather the tweets #
 #######################################################################################
-from utils import db_utils, manage_credentials, read_write, other_utils
+from utils import db_utils, manage_credentials, read_write, other_utils, work_queue, dialogs, metrics
 from tweepy import StreamListener
 import json
-from tkinter import messagebox
+import threading
 from pymongo.errors import ServerSelectionTimeoutError, AutoReconnect
 
 LOG_NAME = " (stream_util) : "
 
 
+# how many worker threads format and store the tweets, how many raw tweets can wait in the queue for them
+# and what we do when the queue is full (see work_queue for the policies)
+WORKERS = 2
+QUEUE_SIZE = 1000
+QUEUE_POLICY = work_queue.BLOCK
+BATCH_SIZE = 50  # the most tweets a worker takes out of the queue at once, to score them in parallel
+
+
 # Class that inherits StreamListener and handles the data.
+# The stream's thread only puts the raw data in a bounded queue, so a slow analysis can't keep it from
+# reading the socket. A pool of worker threads takes the data out of the queue, formats and stores it
 class StdOutListener(StreamListener):
-    def __init__(self):
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, queue_policy=QUEUE_POLICY, spill_path=None):
         super(StdOutListener, self).__init__()
         self.flag = False  # this flag indicates if stream must stop or not. As long as it is False, we keep stream open
         self.pause_flag = False  # as long as false, pause is closed
         self.store_counter = None  # this counter, counts how many tweets stored to the DB so far
+        self.ignore_counter = None
+        self.counter_lock = threading.Lock()  # the workers update the counters at the same time
+        self.writer = db_utils.TweetWriter()  # this buffers the tweets and stores them in batches
+        self.work_queue = work_queue.WorkQueue(max_size=queue_size, policy=queue_policy, spill_path=spill_path)
+        self.workers_number = workers
+        self.workers = []
+        self.running_workers = 0
+        self.lost_connection = False  # if a worker loses the connection to the DB, all workers stop
+        self.keywords = []  # the keywords we track, the workers mark every tweet with those it contains
         read_write.log_message("[INFO]" + LOG_NAME + "StreamListener initialized")
 
     def on_connect(self):
@@ -35,54 +54,163 @@ class StdOutListener(StreamListener):
             keyword = keyword.rstrip()
             read_write.write_keywords(keyword)
 
-        self.store_counter = 0  # initialize the counter
-        self.ignore_counter = 0
+        self.start(stream_controller.search_keyword)
+
+    # method that prepares the listener to receive data: it sets the keywords, initializes the counters and
+    # starts the workers. Sources other than the Streaming Server (e.g. replay) call it instead of on_connect
+    def start(self, search_keyword):
+        self.keywords = [x.strip() for x in search_keyword.split(",")] if search_keyword else []
+        with self.counter_lock:
+            self.store_counter = 0  # initialize the counter
+            self.ignore_counter = 0
+        self.start_workers()
+        self.start_metrics()
+
+    # method that registers the gauges of this listener and starts writing the metrics to the log
+    def start_metrics(self):
+        metrics.set_gauge("queue_depth", self.work_queue.depth, "Raw tweets waiting for the workers")
+        metrics.set_gauge("queue_dropped_tweets", lambda: self.work_queue.dropped,
+                          "Raw tweets dropped because the queue was full")
+        metrics.set_gauge("queue_spilled_tweets", lambda: self.work_queue.spilled,
+                          "Raw tweets spilled to disk because the queue was full")
+        metrics.set_gauge("running_workers", lambda: self.running_workers, "Worker threads that are running")
+        metrics.start_reporting()
 
     def on_data(self, data):
         if self.flag:  # flag keep track if we want to stop the stream
-            read_write.log_message("[INFO]" + LOG_NAME + "Gathered " +
-                                   str(self.store_counter) +
-                                   " tweets - Ignored " + str(self.ignore_counter) +
-                                   " tweets")
-            return False  # return False to terminate the loop
+            return False  # return False to terminate the loop. The workers will finish what is left in the queue
         if self.pause_flag:  # pause flag keeps track if we want to pause the stream
             return True  # return True and do nothing with the data. It's a virtual pause.
 
-        data = json.loads(data)  # turn the incoming data into json format
+        # depending on the policy, this waits for free space, drops the oldest tweet or spills to disk
+        self.work_queue.put(data)
+        return True
 
-        if "user" not in data:  # if tweet has no user, we don't want this tweet
-            print("No user data - ignoring tweet.")
-            self.ignore_counter += 1
-            return True
-        if data["lang"] != "en":  # we deal only with English language text based tweets
-            print("Non English - ignoring tweet.")
-            self.ignore_counter += 1
-            return True
+    # method that starts the workers, if they are not already running (e.g. when the stream re-connects)
+    def start_workers(self):
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        if len(self.workers) > 0:
+            return
+        self.lost_connection = False
+        self.running_workers = self.workers_number
+        for number in range(self.workers_number):
+            worker = threading.Thread(target=self.work, name="StreamWorker-" + str(number), daemon=True)
+            self.workers.append(worker)
+            worker.start()
+        read_write.log_message("[INFO]" + LOG_NAME + str(self.workers_number) + " workers started")
+
+    # the loop of every worker. It keeps working until the stream stops and the queue is empty
+    def work(self):
+        try:
+            while not self.lost_connection and not (self.flag and self.work_queue.depth() == 0):
+                batch = self.work_queue.get_batch(BATCH_SIZE)
+                try:
+                    if len(batch) == 0:  # nothing came, so it's a good time to store the tweets that wait in the buffer
+                        keep_working = self.write_tweet(only_if_due=True)
+                    else:
+                        keep_working = self.process(batch)
+                except Exception as e:  # e.g. a formatting or a classifier error. We lose the batch, not the worker
+                    read_write.log_message("[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e) + " - " +
+                                           str(len(batch)) + " tweets lost")
+                    metrics.increase("errors_total", "worker")
+                    keep_working = True
+                if not keep_working:
+                    self.lost_connection = True
+                    self.set_flag(True)  # so that the stream stops too
+        finally:
+            self.stop_worker()
+
+    # the last worker that stops, stores whatever is left in the buffer
+    def stop_worker(self):
+        with self.counter_lock:
+            self.running_workers -= 1
+            last_worker = self.running_workers == 0
+        if not last_worker:
+            return
+        try:
+            if not self.lost_connection:
+                self.write_tweet()
+        except Exception as e:
+            read_write.log_message("[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e))
+            metrics.increase("errors_total", "worker")
+        read_write.log_message("[INFO]" + LOG_NAME + "Gathered " +
+                               str(self.store_counter) +
+                               " tweets - Ignored " + str(self.ignore_counter) +
+                               " tweets - Dropped " + str(self.work_queue.dropped) +
+                               " tweets - Spilled " + str(self.work_queue.spilled) + " tweets")
+        metrics.stop_reporting()
+
+    # method that formats and stores the raw data of a batch of tweets.
+    # Returns False if we lost the connection to the DB
+    def process(self, batch):
+        tweets = []
+        for data in batch:
+            try:
+                with metrics.timed("parse"):
+                    data = json.loads(data)  # turn the incoming data into json format
+            except ValueError as e:  # a broken message, we can't do anything with it
+                read_write.log_message("[ERROR]" + LOG_NAME + "ValueError: " + str(e))
+                metrics.increase("errors_total", "parse")
+                self.count(0, 1)
+                continue
+
+            if "user" not in data:  # if tweet has no user, we don't want this tweet
+                print("No user data - ignoring tweet.")
+                self.count(0, 1)
+                continue
+            if data["lang"] != "en":  # we deal only with English language text based tweets
+                print("Non English - ignoring tweet.")
+                self.count(0, 1)
+                continue
+            tweets.append(data)
 
         # we pass our data into this static method to clean them and keep only the necessary
-        our_tweet = other_utils.format_tweet(data, method="stream")
+        # all the tweets of the batch are scored together by the scoring processes
+        for our_tweet in other_utils.format_tweets(tweets, method="stream", keywords=self.keywords):
+            if not self.write_tweet(our_tweet):
+                return False
+        return True
+
+    # method that passes our tweet to the writer, or just stores the buffered ones if no tweet is given
+    # (only if they wait long enough, if only_if_due is True). The writer tells us how many tweets were stored
+    # and how many were duplicates, so we keep track how many tweets we stored so far.
+    # Returns False if we lost the connection to the DB
+    def write_tweet(self, tweet=None, only_if_due=False):
         try:
-            # this method try to save our tweet to the active connection to Mongo and returns the outcome
-            # If all are OK, returns True, but if it fail, it returns False. With this way, we keep track
-            # how many tweets we stored so far
-            if db_utils.store_tweet(our_tweet):
-                self.store_counter += 1  # increase the counter
-                if self.store_counter % 100 == 0:  # and if we reach a multiply of 100, we print the result
-                    print("Stored " + str(self.store_counter) + " tweets so far.")
+            if tweet is not None:
+                stored, ignored = self.writer.add(tweet)
+            elif only_if_due:
+                stored, ignored = self.writer.flush_if_due()
             else:
-                self.ignore_counter += 1
+                stored, ignored = self.writer.flush()
         except ServerSelectionTimeoutError as e:
             read_write.log_message("[ERROR]" + LOG_NAME + "ServerSelectionTimeoutError: " + str(e))
-            messagebox.showerror("Error", "Lost Connection to the DB")
+            metrics.increase("errors_total", "db_connection")
+            dialogs.show_error("Error", "Lost Connection to the DB")
             return False
         except AutoReconnect as e:
             read_write.log_message("[ERROR]" + LOG_NAME + "AutoReconnect: " + str(e))
-            messagebox.showerror("Error", "Lost Connection to the DB")
+            metrics.increase("errors_total", "db_connection")
+            dialogs.show_error("Error", "Lost Connection to the DB")
             return False
 
-        # return True to continue the loop
+        self.count(stored, ignored)
         return True
 
+    # method that increases the counters
+    def count(self, stored, ignored):
+        if stored == 0 and ignored == 0:  # nothing was written, e.g. the tweet is still in the buffer
+            return
+        metrics.increase("tweets_total", "stored", stored)
+        metrics.increase("tweets_total", "ignored", ignored)
+        with self.counter_lock:
+            previous_counter = self.store_counter
+            self.store_counter += stored
+            self.ignore_counter += ignored
+            if self.store_counter // 100 > previous_counter // 100:  # if we pass a multiply of 100, we print it
+                print("Stored " + str(self.store_counter) + " tweets so far. Queue depth: " +
+                      str(self.work_queue.depth()) + " - Dropped: " + str(self.work_queue.dropped))
+
     def on_error(self, status):
         # statuses take from here:
         # https://dev.twitter.com/overview/api/response-codes
@@ -108,7 +236,9 @@ class StdOutListener(StreamListener):
 
         print(message)
         read_write.log_message(message)
+        metrics.increase("errors_total", "http_" + str(status))
         read_write.log_message("[INFO]" + LOG_NAME + "Stopping stream")
+        self.set_flag(True)  # so that the workers finish what is left in the queue and stop
         return False  # and stop the stream
 
     def on_disconnect(self, notice):
@@ -117,10 +247,13 @@ class StdOutListener(StreamListener):
                   ", Reason=" + status["reason"] + ", Code=" + str(status["code"])
         print(message)
         read_write.log_message(message)
+        metrics.increase("errors_total", "disconnect")
+        self.set_flag(True)  # so that the workers finish what is left in the queue and stop
         return False
 
     def on_exception(self, exception):
         read_write.log_message("[ERROR]" + LOG_NAME + str(exception))
+        metrics.increase("errors_total", "exception")
         return False
 
     # setters for the flags
@@ -133,9 +266,10 @@ class StdOutListener(StreamListener):
 
 # class that is responsible to start or close the threads of the stream
 class StreamController(object):
-    def __init__(self):
+    def __init__(self, **listener_options):
         self.search_keyword = None
-        self.listener = StdOutListener()
+        self.listener = StdOutListener(**listener_options)  # e.g. workers, queue_size, queue_policy, spill_path
+        self.active_stream = None
         read_write.log_message("[INFO]" + LOG_NAME + "StreamController initialized")
 
     # method that starts the Streaming API
@@ -154,11 +288,16 @@ class StreamController(object):
     def pause(self):
         self.listener.set_pause(True)
 
+    # returns True while the stream's thread runs
+    def is_running(self):
+        return self.active_stream is not None and self.active_stream.running
+
     def unpause(self):
         self.listener.set_pause(False)
 
     def stream(self):
         stream = manage_credentials.get_stream(listener=self.listener)
+        self.active_stream = stream
         # this is a try-except block, because if there is something wrong in the Listener class,
         # like e.g internet connection failure, it raises the exception inside the active thread
         try:
@@ -175,8 +314,8 @@ class StreamController(object):
             message = "[ERROR]" + LOG_NAME + "AttributeError: " + str(e)
             print(message)
             read_write.log_message(message)
-            messagebox.showerror("Fatal error", "No credentials were found. Please close the script, " +
-                                 "add the file and try again!")
+            dialogs.show_error("Fatal error", "No credentials were found. Please close the script, " +
+                               "add the file and try again!")
         except Exception as e:
             message = "[ERROR]" + LOG_NAME + "Exception: " + str(repr(e))
             print(message)
@@ -201,7 +340,7 @@ def start_stream(frame):
         stream_controller.search_keyword = frame.keyword_entry.get()  # and set the keyword into controller,
         stream_controller.combine()  # to start the stream
     else:
-        messagebox.showerror("Error", "Enter a keyword")
+        dialogs.show_error("Error", "Enter a keyword")
 
 
 # function to handle the Pause/Un-pause button events
@@ -1,11 +1,13 @@
 #####################################################################################################
 # Module that is responsible for the polarity and subjectivity training of the tweets               #
 #####################################################################################################
-from utils import read_write
+from utils import read_write, vocabulary, naive_bayes, features
 import sys
-import os.path
-import string
-from tkinter import messagebox
+import os
+import functools
+import tempfile
+import threading
+import time
 from random import shuffle
 try:
     from nltk import classify
@@ -19,7 +21,6 @@ except ImportError as e:
 try:
     from nltk.corpus import movie_reviews
     from nltk.corpus import subjectivity
-    from nltk.corpus import stopwords
 except LookupError as e:
     read_write.log_message("[FATAL] (training) : LookupError: " + str(e))
     instructions = " ****   INSTALLATION INSTRUCTIONS   ****\n\n"
@@ -33,50 +34,155 @@ except LookupError as e:
 
 LOG_NAME = " (training) : "
 
-
-def start_training():
-    pol_checkfile = os.path.exists('files/sa_polarity.pickle')
-    subj_checkfile = os.path.exists('files/sa_subjectivity.pickle')
-    if pol_checkfile:
-        message1 = "SA Polarity file already exists."
-        messagebox.showinfo("File found", message1)
-    else:
-        message1 = "Cannot find the polarity sentiment analyzer file.\n"
-        message1 += "Training a new one using Naive Bayes Classifier.\n"
-        message1 += "Be patient. It might take a while."
-        messagebox.showinfo("Training", message1)
-        train_sentiment_analyzer_polarity(1000)
-        messagebox.showinfo("Training", "Polarity Training finished.")
-    read_write.log_message("[INFO]" + LOG_NAME + message1)
-    if subj_checkfile:
-        message2 = "SA Subjectivity file already exists."
-        messagebox.showinfo("File found", message2)
+POLARITY_FILE = 'files/sa_polarity.pickle'
+SUBJECTIVITY_FILE = 'files/sa_subjectivity.pickle'
+
+
+# the exception that the training raises in the middle, when the user cancels it
+class TrainingCancelled(Exception):
+    pass
+
+
+# class that runs the trainings in a background thread, so the GUI doesn't freeze, and keeps their progress
+# (phase, documents featurized, elapsed time) that the GUI reads every now and then. The new classifiers replace
+# the old files only when they are ready (see save_model), so a running stream uses the old ones until then
+class TrainingController(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.cancel_event = threading.Event()
+        self.phase = None
+        self.documents = 0  # documents featurized in this phase
+        self.total_documents = 0
+        self.start_time = None
+        self.end_time = None
+        self.result = None  # "finished", "cancelled" or "failed", once the thread ends
+        self.message = ""
+        self.saved = []  # the models of this training that are trained and saved already
+
+    # method that starts the training of the given models (the keys of TRAINERS) in a new thread.
+    # Returns False if a training is running already
+    def start(self, models):
+        with self.lock:
+            if self.is_running():
+                return False
+            self.cancel_event.clear()
+            self.phase = "Starting"
+            self.documents = 0
+            self.total_documents = 0
+            self.start_time = time.time()
+            self.end_time = None
+            self.result = None
+            self.message = ""
+            self.saved = []
+            self.thread = threading.Thread(target=self.run, args=(list(models),), name="Training", daemon=True)
+            self.thread.start()
+        read_write.log_message("[INFO]" + LOG_NAME + "Training of " + ", ".join(models) + " started")
+        return True
+
+    def run(self, models):
+        try:
+            for model in models:
+                TRAINERS[model](self)
+                self.saved.append(model)  # a trainer returns only after it saved its classifier
+            self.finish("finished", "Training finished.")
+        except TrainingCancelled:
+            self.finish("cancelled", "Training cancelled. " + self.saved_text())
+        except Exception as e:  # e.g. a corpus or the disk, the thread has nobody else to tell
+            read_write.log_message("[ERROR]" + LOG_NAME + type(e).__name__ + ": " + str(e))
+            self.finish("failed", "Training failed: " + type(e).__name__ + ": " + str(e) + ". " + self.saved_text())
+
+    # returns which classifiers the training changed before it stopped, for the message of the user
+    def saved_text(self):
+        if len(self.saved) == 0:
+            return "The classifiers were not changed."
+        return "Saved before it stopped: " + ", ".join(self.saved) + ". The others were not changed."
+
+    def finish(self, result, message):
+        with self.lock:
+            self.result = result
+            self.message = message
+            self.end_time = time.time()
+        read_write.log_message("[INFO]" + LOG_NAME + message)
+
+    # method that asks the thread to stop. It stops at the next document or phase, but never while saving
+    def cancel(self):
+        if self.is_running():
+            self.cancel_event.set()
+            read_write.log_message("[INFO]" + LOG_NAME + "Cancelling the training...")
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # the trainers call this when they start a phase. It raises TrainingCancelled if the user cancelled
+    def set_phase(self, phase, total_documents=0):
+        self.check_cancelled()
+        with self.lock:
+            self.phase = phase
+            self.documents = 0
+            self.total_documents = total_documents
+        print(phase)
+
+    # the trainers call this for every featurized document
+    def featurized(self, documents=1):
+        self.check_cancelled()
+        with self.lock:
+            self.documents += documents
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TrainingCancelled()
+
+    # returns a copy of the progress, that another thread can read safely
+    def progress(self):
+        with self.lock:
+            if self.start_time is None:
+                elapsed = 0
+            else:
+                elapsed = (self.end_time or time.time()) - self.start_time
+            return {"phase": self.phase, "documents": self.documents, "total_documents": self.total_documents,
+                    "elapsed": elapsed, "running": self.is_running(), "cancelling": self.cancel_event.is_set(),
+                    "result": self.result, "message": self.message}
+
+
+# trains on the tweets of the active collection. tweet_training is imported only here, because it imports
+# this module and it needs a database
+def train_on_tweets(model, controller):
+    from utils import tweet_training
+    if model == "polarity":
+        tweet_training.train_polarity(controller=controller)
     else:
-        message2 = "Cannot find the subjectivity sentiment analyzer file.\n"
-        message2 += "Training a new one using Naive Bayes Classifier.\n"
-        message2 += "Be patient. It might take a while."
-        messagebox.showinfo("Training", message2)
-        train_sentiment_analyzer_subjectivity(5000)
-        messagebox.showinfo("Training", "Subjectivity Training finished.")
-    read_write.log_message("[INFO]" + LOG_NAME + message2)
+        tweet_training.train_subjectivity(controller=controller)
+
+
+# the trainings that TrainingController can run, by their name. Every one gets the controller
+TRAINERS = {"polarity": lambda controller: train_sentiment_analyzer_polarity(1000, controller=controller),
+            "subjectivity": lambda controller: train_sentiment_analyzer_subjectivity(5000, controller=controller),
+            "tweets_polarity": lambda controller: train_on_tweets("polarity", controller),
+            "tweets_subjectivity": lambda controller: train_on_tweets("subjectivity", controller)}
+
+
+# this controller, like the stream_controller of stream_util, lives as long as the program, so a training goes on
+# when the user leaves the main menu
+training_controller = TrainingController()
+
+
+# returns the models that have no classifier file yet
+def missing_models():
+    models = []
+    if not os.path.exists(POLARITY_FILE):
+        models.append("polarity")
+    if not os.path.exists(SUBJECTIVITY_FILE):
+        models.append("subjectivity")
+    return models
 
 
 def bag_of_words(words):
-    stopwords_english = stopwords.words('english')
-    punctuation = list(string.punctuation)
-    punctuation.append("''")
-    punctuation.append("``")
-    punctuation.append("—")
-    punctuation.append("…")
-    punctuation.append("...")
-    punctuation.append("--")
-    punctuation.append("..")
-    stopwords_english.extend(punctuation)
     words_clean = []
 
     for word in words:
         word = word.lower()
-        if word not in stopwords_english and word not in string.digits:
+        if word not in vocabulary.training_stops and word not in vocabulary.digits:
             words_clean.append(word)
 
     words_dictionary = dict([word, True] for word in words_clean)
@@ -84,54 +190,76 @@ def bag_of_words(words):
     return words_dictionary
 
 
-def train_sentiment_analyzer_polarity(n_instances=None):
+# the words of bag_of_words of a movie review. The processes of features.parallel_map run this
+def movie_review_words(fileid):
+    return list(bag_of_words(movie_reviews.words(fileid)).keys())
+
+
+# the unigrams that a document has. The processes of features.parallel_map run this
+def unigram_hits(unigrams, document):
+    return [word for word in set(document) if word in unigrams]
+
+
+# function that returns the accuracy of a compiled classifier on the given documents of a features.FeatureMatrix
+def matrix_accuracy(compiled, matrix, documents):
+    if len(documents) == 0:
+        return 0
+    results = compiled.classify_batch([matrix.words_of(document) for document in documents])
+    correct = sum(1 for document, label in zip(documents, results) if matrix.labels[document] == label)
+    return correct / len(documents)
+
+
+def train_sentiment_analyzer_polarity(n_instances=None, controller=None):
+    if controller is None:
+        controller = TrainingController()  # nobody reads its progress
 
     if n_instances is not None:
         n_instances = int(0.2*n_instances)
 
-    pos_reviews = []
-    for fileid in movie_reviews.fileids('pos'):
-        words = movie_reviews.words(fileid)
-        pos_reviews.append(words)
-
-    neg_reviews = []
-    for fileid in movie_reviews.fileids('neg'):
-        words = movie_reviews.words(fileid)
-        neg_reviews.append(words)
+    # the words of every review are extracted once and kept in the cache (see features)
+    fileids = [(fileid, 'pos') for fileid in movie_reviews.fileids('pos')]
+    fileids += [(fileid, 'neg') for fileid in movie_reviews.fileids('neg')]
 
-    # positive reviews feature set
-    pos_reviews_set = []
-    for words in pos_reviews:
-        pos_reviews_set.append((bag_of_words(words), 'pos'))
+    def build():
+        documents = features.parallel_map(movie_review_words, [fileid for fileid, _ in fileids],
+                                          progress=controller.featurized)
+        return features.FeatureMatrix.from_documents(documents, [label for _, label in fileids])
+    controller.set_phase("Polarity: extracting features", total_documents=len(fileids))
+    matrix = features.cached_matrix("movie_reviews", [fileid for fileid, _ in fileids], build)
 
-    # negative reviews feature set
-    neg_reviews_set = []
-    for words in neg_reviews:
-        neg_reviews_set.append((bag_of_words(words), 'neg'))
+    pos_reviews = [document for document in range(len(matrix)) if matrix.labels[document] == 'pos']
+    neg_reviews = [document for document in range(len(matrix)) if matrix.labels[document] == 'neg']
 
-    shuffle(pos_reviews_set)
-    shuffle(neg_reviews_set)
+    shuffle(pos_reviews)
+    shuffle(neg_reviews)
 
-    test_set = pos_reviews_set[:n_instances] + neg_reviews_set[:n_instances]
-    train_set = pos_reviews_set[n_instances:] + neg_reviews_set[n_instances:]
+    test_set = pos_reviews[:n_instances] + neg_reviews[:n_instances]
+    train_set = pos_reviews[n_instances:] + neg_reviews[n_instances:]
 
-    print('Training classifier')
-    classifier = NaiveBayesClassifier.train(train_set)
+    controller.set_phase("Polarity: training")
+    classifier = naive_bayes.train_bag_of_words(matrix, train_set)
 
     print(classifier.show_most_informative_features(10))
 
-    classifier_accuracy_percent = (classify.accuracy(classifier, test_set)) * 100
+    controller.set_phase("Polarity: testing")
+    classifier_accuracy_percent = matrix_accuracy(naive_bayes.compile_bag_of_words(classifier), matrix,
+                                                  test_set) * 100
     message_acc = 'Accuracy of classifier = ' + str(classifier_accuracy_percent) + '%'
     print(message_acc)
     read_write.log_message("[INFO]" + LOG_NAME + message_acc)
 
-    save_file(classifier, 'files/sa_polarity.pickle')
+    controller.set_phase("Polarity: saving")  # the last chance to cancel, a save is never cancelled
+    save_model(classifier, POLARITY_FILE)
     message = "sa_polarity.pickle file saved."
     print(message)
     read_write.log_message(message)
 
 
-def train_sentiment_analyzer_subjectivity(n_instances=None):
+def train_sentiment_analyzer_subjectivity(n_instances=None, controller=None):
+    if controller is None:
+        controller = TrainingController()
+
+    controller.set_phase("Subjectivity: reading the corpus")
     if n_instances is not None:
         n_instances = int(n_instances / 2)
 
@@ -151,44 +279,68 @@ def train_sentiment_analyzer_subjectivity(n_instances=None):
 
     all_words = sentim_analyzer.all_words([mark_negation(doc) for doc in training_docs])
 
-    stopwords_english = stopwords.words('english')
-    punctuation = list(string.punctuation)
-    punctuation.append("''")
-    punctuation.append("``")
-    punctuation.append("—")
-    punctuation.append("…")
-    punctuation.append("...")
-    punctuation.append("--")
-    punctuation.append("..")
-    stopwords_english.extend(punctuation)
     all_words_clean = []
     for word in all_words:
-        if word not in stopwords_english and word not in string.digits:
+        if word not in vocabulary.training_stops and word not in vocabulary.digits:
             all_words_clean.append(word)
 
     # Add simple unigram word features
     unigram_feats = sentim_analyzer.unigram_word_feats(all_words_clean, min_freq=4)
     sentim_analyzer.add_feat_extractor(extract_unigram_feats, unigrams=unigram_feats)
 
-    # Apply features to obtain a feature-value representation of our datasets
-    training_set = sentim_analyzer.apply_features(training_docs)
-    testing_set = sentim_analyzer.apply_features(testing_docs)
+    # Instead of a featureset with every unigram for every document, the matrix keeps only the unigrams that
+    # a document has: the training documents first and then the testing ones
+    documents = training_docs + testing_docs
 
-    trainer = NaiveBayesClassifier.train
-    classifier = sentim_analyzer.train(trainer, training_set)
-    try:
-        classifier.show_most_informative_features()
-    except AttributeError:
-        message = "Your classifier does not provide a show_most_informative_features() method."
-        print(message)
-        read_write.log_message(message)
-        sentim_analyzer.evaluate(testing_set)
-    classifier_accuracy_percent = (classify.accuracy(classifier, testing_set)) * 100
+    def build():
+        hits = features.parallel_map(functools.partial(unigram_hits, frozenset(unigram_feats)),
+                                     [doc for doc, _ in documents], progress=controller.featurized)
+        return features.FeatureMatrix.from_documents(hits, [label for _, label in documents], unigram_feats)
+    controller.set_phase("Subjectivity: extracting features", total_documents=len(documents))
+    matrix = features.cached_matrix("subjectivity", [n_instances, len(training_docs), unigram_feats], build)
+
+    training_set = list(range(len(training_docs)))
+    testing_set = list(range(len(training_docs), len(documents)))
+
+    controller.set_phase("Subjectivity: training")
+    sentim_analyzer.classifier = naive_bayes.train_unigrams(matrix, training_set)
+    classifier = sentim_analyzer.classifier
+    classifier.show_most_informative_features()
+
+    controller.set_phase("Subjectivity: testing")
+    classifier_accuracy_percent = matrix_accuracy(naive_bayes.compile_unigram_analyzer(sentim_analyzer), matrix,
+                                                  testing_set) * 100
     message_acc = 'Accuracy of classifier = ' + str(classifier_accuracy_percent) + '%'
     print(message_acc)
     read_write.log_message("[INFO]" + LOG_NAME + message_acc)
 
-    save_file(sentim_analyzer, 'files/sa_subjectivity.pickle')
+    controller.set_phase("Subjectivity: saving")
+    save_model(sentim_analyzer, SUBJECTIVITY_FILE)
     message = "sa_subjectivity.pickle file saved."
     print(message)
     read_write.log_message(message)
+
+
+# function that pickles the model and saves its compiled form in the compact format too (see naive_bayes),
+# that the stream loads much faster than the pickle. Both are written in a temporary file first, that replaces
+# the old one at once, so a running stream reads either the whole old classifier or the whole new one.
+# The pickle goes first: the stream loads the compact model only if it isn't older than the pickle
+def save_model(model, path):
+    # a new temporary file every time, in the same folder so os.replace doesn't move it across disks
+    folder = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=folder, prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                     delete=False) as temporary_file:
+        temporary_path = temporary_file.name
+    try:
+        save_file(model, temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:  # e.g. a full disk, we don't leave the half written file behind
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+    try:
+        naive_bayes.save_compiled(naive_bayes.compile_model(model), naive_bayes.model_path_of(path))
+    except ValueError as e:  # the stream will use the pickle
+        read_write.log_message("[WARN]" + LOG_NAME + "ValueError: " + str(e))
@@ -0,0 +1,213 @@
+############################################################################################################
+# Module that trains the classifiers on the tweets of a MongoDB collection, instead of NLTK's corpora.    #
+# A tweet is labeled only if the analyzers agree on it (see db_utils.AGREEMENTS), like the stats screen   #
+# counts them. The tweets are read with a cursor, one batch at a time, and only the counts of their words #
+# are kept, so even a collection of millions of tweets is trained in a bounded amount of memory.          #
+# Example: python -m utils.tweet_training --db twitter --collection tweets --batch-size 2000              #
+############################################################################################################
+from utils import read_write, db_utils, training, sentiment_utils, other_utils, naive_bayes, ingest, dialogs
+import argparse
+import heapq
+import sys
+try:
+    from nltk.sentiment import SentimentAnalyzer
+    from nltk.sentiment.util import extract_unigram_feats
+except ImportError as e:
+    read_write.log_message("[FATAL] (tweet_training) : ImportError: " + str(e))
+    sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
+
+LOG_NAME = " (tweet_training) : "
+
+BATCH_SIZE = 1000  # tweets that MongoDB sends at a time
+MAX_COUNTED_WORDS = 1000000  # distinct words that we count, before we drop the rarest of them
+MAX_VOCABULARY = 50000  # the most frequent words become the features of a classifier
+MIN_DOCUMENTS = 3  # and only if they are found in this many tweets
+TEST_EVERY = 10  # every TEST_EVERY-th tweet of a label is kept for testing, instead of training
+MAX_TEST_DOCUMENTS = 10000  # tweets of every label kept for testing
+REPORT_EVERY = 100000  # tweets between two progress messages in the log
+
+# the labels of every model and the function that returns the tokens its classifier sees in a text
+MODELS = {"polarity": (["pos", "neg"], sentiment_utils.polarity_tokens),
+          "subjectivity": (["subj", "obj"], sentiment_utils.subjectivity_tokens)}
+
+
+# Class that counts in how many tweets of every label every word is found. When there are more than max_words
+# distinct words, the words found in the fewest tweets are dropped (like lossy counting does). A dropped word that
+# comes back later starts counting from zero, so the counts of the rare words are a little low, but the frequent
+# words, that become the features, stay
+class WordCounts(object):
+    def __init__(self, labels, max_words=MAX_COUNTED_WORDS):
+        self.labels = list(labels)
+        self.documents = {label: 0 for label in self.labels}
+        self.counts = {}  # word => a list with a count for every label
+        self.max_words = max_words
+
+    # method that counts a tweet of a label, with its tokens
+    def add(self, label, tokens):
+        column = self.labels.index(label)
+        self.documents[label] += 1
+        for token in set(tokens):  # a featureset has every word once
+            row = self.counts.get(token)
+            if row is None:
+                if len(self.counts) >= self.max_words:
+                    self.prune()
+                row = self.counts[token] = [0] * len(self.labels)
+            row[column] += 1
+
+    # drops the rarest words, until a quarter of max_words is free, so we don't prune again for the next word
+    def prune(self):
+        threshold = 0
+        while len(self.counts) > self.max_words * 3 // 4:
+            threshold += 1
+            self.counts = {word: row for word, row in self.counts.items() if sum(row) > threshold}
+        read_write.log_message("[INFO]" + LOG_NAME + "Words found in up to " + str(threshold) +
+                               " tweets were dropped, " + str(len(self.counts)) + " words left")
+
+    # returns the counts of naive_bayes.bag_of_words_classifier and unigram_classifier, for the max_vocabulary
+    # words found in the most tweets, if they are found in at least min_documents tweets
+    def vocabulary_counts(self, max_vocabulary=MAX_VOCABULARY, min_documents=MIN_DOCUMENTS):
+        totals = ((sum(row), word) for word, row in self.counts.items())
+        frequent = heapq.nlargest(max_vocabulary, (total for total in totals if total[0] >= min_documents))
+        word_counts = {}
+        for _, word in frequent:
+            word_counts[word] = {label: count for label, count in zip(self.labels, self.counts[word]) if count > 0}
+        return dict(self.documents), word_counts
+
+
+# function that reads the tweets of every label of a model from the active collection and counts their words.
+# Returns the WordCounts and the list of the (tokens, label) of the tweets kept for testing.
+# limit is the most tweets of every label that we read, or None for all of them
+def count_tweets(model, batch_size=BATCH_SIZE, limit=None, controller=None):
+    if controller is None:
+        controller = training.TrainingController()  # nobody reads its progress
+    labels, tokens_of = MODELS[model]
+    word_counts = WordCounts(labels)
+    testing = []
+    # to show the progress we only read the counters. If they are not complete we don't count the collection
+    # for them (that is a scan as long as the training), the progress just has no total
+    summary = db_utils.read_counters()
+
+    for label in labels:
+        if summary is None:
+            total = 0
+        else:
+            total = summary["agree"][label] if limit is None else min(limit, summary["agree"][label])
+        controller.set_phase("Tweets " + model + ": reading the '" + label + "' tweets", total_documents=total)
+        tested = 0
+        cursor = db_utils.agreed_tweets(label, {"text.words": True, "_id": False}, batch_size, limit)
+        try:
+            for number, tweet in enumerate(cursor):
+                controller.featurized()
+                if not isinstance(tweet.get("text"), dict):  # not a tweet that the stream stored
+                    continue
+                tokens = tokens_of(other_utils.useful_words_of(tweet["text"]))
+                if number % TEST_EVERY == 0 and tested < MAX_TEST_DOCUMENTS:
+                    testing.append((list(tokens), label))
+                    tested += 1
+                else:
+                    word_counts.add(label, tokens)
+                if (number + 1) % REPORT_EVERY == 0:
+                    read_write.log_message("[INFO]" + LOG_NAME + str(number + 1) + " '" + label + "' tweets read, " +
+                                           str(len(word_counts.counts)) + " words counted")
+        finally:
+            cursor.close()  # e.g. when the user cancels, we don't leave the cursor open on the server
+        if word_counts.documents[label] == 0:
+            raise ValueError("There are no '" + label + "' tweets that the analyzers agree on, to train the " +
+                             model + " classifier")
+        read_write.log_message("[INFO]" + LOG_NAME + str(word_counts.documents[label]) + " '" + label +
+                               "' tweets counted for training")
+    return word_counts, testing
+
+
+# function that logs the accuracy of a compiled classifier on the tweets kept for testing
+def log_accuracy(compiled, testing):
+    if len(testing) == 0:
+        return
+    results = compiled.classify_batch([tokens for tokens, _ in testing])
+    correct = sum(1 for (_, label), result in zip(testing, results) if label == result)
+    message_acc = 'Accuracy of classifier = ' + str(correct / len(testing) * 100) + '% on ' + str(len(testing)) + \
+                  ' tweets'
+    print(message_acc)
+    read_write.log_message("[INFO]" + LOG_NAME + message_acc)
+
+
+# trains the polarity classifier on the tweets that the analyzers agree are positive or negative.
+# Its features are the max_vocabulary words found in the most tweets
+def train_polarity(batch_size=BATCH_SIZE, limit=None, controller=None, max_vocabulary=MAX_VOCABULARY):
+    if controller is None:
+        controller = training.TrainingController()
+    word_counts, testing = count_tweets("polarity", batch_size, limit, controller)
+
+    controller.set_phase("Tweets polarity: training")
+    classifier = naive_bayes.bag_of_words_classifier(*word_counts.vocabulary_counts(max_vocabulary))
+    word_counts = None  # the counts can be large, we don't need them anymore
+    print(classifier.show_most_informative_features(10))
+
+    controller.set_phase("Tweets polarity: testing")
+    log_accuracy(naive_bayes.compile_bag_of_words(classifier), testing)
+
+    controller.set_phase("Tweets polarity: saving")
+    training.save_model(classifier, training.POLARITY_FILE)
+    read_write.log_message("[INFO]" + LOG_NAME + "Polarity classifier trained on tweets and saved")
+
+
+# trains the subjectivity analyzer on the tweets that the analyzers agree are subjective or objective.
+# Its unigrams are the max_vocabulary words found in the most tweets
+def train_subjectivity(batch_size=BATCH_SIZE, limit=None, controller=None, max_vocabulary=MAX_VOCABULARY):
+    if controller is None:
+        controller = training.TrainingController()
+    word_counts, testing = count_tweets("subjectivity", batch_size, limit, controller)
+
+    controller.set_phase("Tweets subjectivity: training")
+    label_counts, counts = word_counts.vocabulary_counts(max_vocabulary)
+    word_counts = None
+    sentim_analyzer = SentimentAnalyzer()
+    sentim_analyzer.add_feat_extractor(extract_unigram_feats, unigrams=sorted(counts))
+    sentim_analyzer.classifier = naive_bayes.unigram_classifier(label_counts, counts)
+    sentim_analyzer.classifier.show_most_informative_features()
+
+    controller.set_phase("Tweets subjectivity: testing")
+    log_accuracy(naive_bayes.compile_unigram_analyzer(sentim_analyzer), testing)
+
+    controller.set_phase("Tweets subjectivity: saving")
+    training.save_model(sentim_analyzer, training.SUBJECTIVITY_FILE)
+    read_write.log_message("[INFO]" + LOG_NAME + "Subjectivity analyzer trained on tweets and saved")
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.tweet_training",
+                                     description="Train the classifiers on the tweets of a MongoDB collection "
+                                                 "that the analyzers agree on.")
+    ingest.add_database_arguments(parser)
+    parser.add_argument("--models", nargs="+", default=sorted(MODELS), choices=sorted(MODELS),
+                        help="classifiers to train (default: all of them)")
+    parser.add_argument("--batch-size", default=BATCH_SIZE, type=int,
+                        help="tweets that MongoDB sends at a time (default: %(default)s)")
+    parser.add_argument("--limit", default=None, type=int,
+                        help="the most tweets of every label to train on (default: all of them)")
+    parser.add_argument("--max-vocabulary", default=MAX_VOCABULARY, type=int,
+                        help="the most frequent words that become features (default: %(default)s)")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    dialogs.set_headless()
+    read_write.log_message("[INFO]" + LOG_NAME + "Training on tweets starts")
+    ingest.select_collection(options)  # and the indexes of the agreement queries
+    try:
+        if "polarity" in options.models:
+            train_polarity(options.batch_size, options.limit, max_vocabulary=options.max_vocabulary)
+        if "subjectivity" in options.models:
+            train_subjectivity(options.batch_size, options.limit, max_vocabulary=options.max_vocabulary)
+    except ValueError as e:
+        read_write.log_message("[ERROR]" + LOG_NAME + "ValueError: " + str(e))
+        sys.exit("[SEVERE] " + str(e))
+    except KeyboardInterrupt:  # a classifier is saved only at the end of its training, so nothing is half written
+        read_write.log_message("[INFO]" + LOG_NAME + "Training on tweets interrupted")
+        sys.exit(1)
+    read_write.log_message("[INFO]" + LOG_NAME + "Training on tweets finished")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#######################################################################################################
+# Module that holds the precomputed word sets (stop words, punctuation etc.) used to clear the texts  #
+#######################################################################################################
+from utils import read_write
+import sys
+import string
+
+try:
+    from nltk.corpus import stopwords
+except ImportError as e:
+    read_write.log_message("[FATAL] (vocabulary) : ImportError: " + str(e))
+    sys.exit("[SEVERE] " + str(e) + ". Please install this module to continue")
+
+LOG_NAME = " (vocabulary) : "
+
+try:
+    english_stopwords = frozenset(stopwords.words('english'))
+except LookupError as e:
+    read_write.log_message("[FATAL] (vocabulary) : LookupError: " + str(e))
+    instructions = " ****   INSTALLATION INSTRUCTIONS   ****\n\n"
+    instructions += "    1) Open a new terminal and type python. This will open a python terminal\n"
+    instructions += "    2) Type import ntlk\n    3) Type nltk.download()\n"
+    instructions += "    4) This will open a new window. Search in CORPORA for the package named 'Stopwords'\n"
+    instructions += "    5) Double click OR click download to install it"
+    read_write.log_message(instructions)
+    sys.exit(str(e) + "\n" + instructions)
+
+# all sets are frozensets, so checking if a token belongs to one of them costs the same, no matter its size
+punctuation = frozenset(list(string.punctuation) + ["''", "``", "—", "…", "...", "--", ".."])
+
+# stop words and punctuation marks that the classifiers' training ignores
+training_stops = english_stopwords | punctuation
+
+# stop words and punctuation marks that we don't keep as meaningful words of a tweet
+tweet_stops = training_stops | {"rt"}
+
+# the training used to check "word not in string.digits", which is true for every part of "0123456789"
+# (e.g. "1", "23", "789" but not "42"), so we keep all these parts to ignore exactly the same words
+digits = frozenset(string.digits[start:end]
+                   for start in range(len(string.digits) + 1)
+                   for end in range(start, len(string.digits) + 1))
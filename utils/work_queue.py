@@ -0,0 +1,128 @@
+###############################################################################################
+# Module that holds the bounded queue between the stream's thread and the workers that format #
+# and store the tweets                                                                        #
+###############################################################################################
+import itertools
+import os
+import queue
+import threading
+
+LOG_NAME = " (work_queue) : "
+
+# what we do when a new item comes and the queue is full
+BLOCK = "block"  # wait until a worker takes an item out of the queue
+DROP_OLDEST = "drop-oldest"  # throw away the oldest item of the queue, to make room for the new one
+SPILL = "spill"  # write the new item in a file on disk, and read it back when the workers have time for it
+POLICIES = [BLOCK, DROP_OLDEST, SPILL]
+
+queue_numbers = itertools.count(1)  # numbers the queues of a process, so each of them has its own spill file
+
+
+# returns a spill file that no other queue uses: one for every process and every queue in it
+def default_spill_path():
+    return os.path.abspath(os.path.join("files", "spill-" + str(os.getpid()) + "-" + str(next(queue_numbers)) +
+                                        ".jsonl"))
+
+
+class WorkQueue(object):
+    def __init__(self, max_size=1000, policy=BLOCK, spill_path=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown queue policy '" + str(policy) + "'. Use one of " + str(POLICIES))
+        self.queue = queue.Queue(maxsize=max_size)
+        self.policy = policy
+        self.spill_path = spill_path or default_spill_path()
+        self.lock = threading.Lock()  # guards the counters and the spill file
+        self.dropped = 0  # how many items we threw away so far
+        self.spilled = 0  # how many items we wrote on disk so far
+        self.spill_pending = 0  # how many items are on disk right now
+        self.read_offset = 0  # where the first of them starts in the spill file
+
+    # puts a new item (a line of text) in the queue, according to the policy we have
+    def put(self, item):
+        if self.policy == BLOCK:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.policy == DROP_OLDEST:
+                self.drop_oldest(item)
+            else:
+                self.spill([item])
+
+    def drop_oldest(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    with self.lock:
+                        self.dropped += 1
+                except queue.Empty:  # a worker emptied the queue in the meantime, so just try again
+                    pass
+
+    # writes the items at the end of the spill file. If nothing is pending, we start the file from the beginning
+    def spill(self, items):
+        with self.lock:
+            with open(self.spill_path, "ab" if self.spill_pending > 0 else "wb") as spill_file:
+                for item in items:
+                    spill_file.write((item.rstrip("\n") + "\n").encode("utf-8"))
+            self.spilled += len(items)
+            self.spill_pending += len(items)
+
+    # returns the next item or None if there is nothing to do after waiting for timeout seconds
+    def get(self, timeout=0.5):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return self.reload()
+
+    # returns a list of up to max_items items. It waits timeout seconds only for the first one,
+    # so the list is empty if there is nothing to do
+    def get_batch(self, max_items, timeout=0.5):
+        item = self.get(timeout)
+        if item is None:
+            return []
+        batch = [item]
+        while len(batch) < max_items:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # when the queue is empty, we read back the spilled items from where we stopped the last time, until the queue
+    # is full. The rest stay where they are in the file, so we never read or write an item twice. The file is
+    # deleted when all of its items are read
+    def reload(self):
+        with self.lock:
+            if self.spill_pending == 0:
+                return None
+            first_item = None
+            with open(self.spill_path, "rb") as spill_file:
+                spill_file.seek(self.read_offset)
+                while self.spill_pending > 0:
+                    line = spill_file.readline()
+                    if not line:  # the file has fewer items than we counted, there is nothing more to read
+                        self.spill_pending = 0
+                        break
+                    item = line.decode("utf-8").rstrip("\n")
+                    if first_item is None:
+                        first_item = item
+                    else:
+                        try:
+                            self.queue.put_nowait(item)
+                        except queue.Full:
+                            break
+                    self.read_offset = spill_file.tell()
+                    self.spill_pending -= 1
+            if self.spill_pending == 0:
+                os.remove(self.spill_path)
+                self.read_offset = 0
+        return first_item
+
+    # how many items are waiting to be processed, in memory and on disk
+    def depth(self):
+        return self.queue.qsize() + self.spill_pending